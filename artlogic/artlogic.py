@@ -1,12 +1,40 @@
 #!/usr/bin/python
 
-from flask import Blueprint, redirect, render_template, request, url_for
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    render_template,
+    request,
+    stream_with_context,
+)
+import hashlib
+import json
+import artlogic.cache as cache
 import artlogic.encode as encode
 import artlogic.forms as forms
 
-
 TITLE = "Art & Logic Programming Challenge"
 
+# Request bodies with these content types are read as one JSON document per line,
+# rather than as a single JSON array.
+NDJSON_MIMETYPES = ["application/x-ndjson", "application/jsonl"]
+
+# How many encode/decode results to keep for repeated inputs and result ids, and how
+# many characters of them. Outputs longer than RESULT_CACHE_MAX_RESULT aren't kept at
+# all, so a few huge inputs can't push everything else out.
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_BYTES = 16 << 20
+RESULT_CACHE_MAX_RESULT = 64 << 10
+# How long caches can keep an output without checking back. The output for an input
+# can change when the encoding rules do, so this is kept short (and the ETag is a hash
+# of the output, so revalidating after a change gets the new one).
+RESULT_MAX_AGE = 60 * 60
+
+results = cache.ResultCache(
+    RESULT_CACHE_SIZE, RESULT_CACHE_BYTES, max_result_bytes=RESULT_CACHE_MAX_RESULT
+)
+
 artlogicApp = Blueprint("artlogic", __name__)
 
 
@@ -20,49 +48,135 @@ def index():
 
     # If the submit button is clicked and the form validates, we'll handle
     # the data (converting between strings and integers as necessary) and
-    # return the same page with the output.
+    # return the same page with the output. The output is rendered straight
+    # away rather than redirected to, since the result cache belongs to each
+    # worker process and the next request may well go to another one.
     if form.validate_on_submit():
-        output = handleData(form.data["input_data"])
-        return redirect(url_for("artlogic.index", output=output))
+        _, output = results.get_or_compute(form.data["input_data"], handleData)
+    else:
+        # If the submit button hasn't been clicked, we'll just return the page
+        # with whatever output is currently set (if no data has been submitted
+        # previously, the output will be blank).
+        output = request.args.get("output")
 
-    # If the submit button hasn't been clicked, we'll just return the page
-    # with whatever output is currently set (if no data has been submitted
-    # previously, the output will be blank).
     return render_template(
-        "artlogic/artlogic.html",
-        title=TITLE,
-        form=form,
-        output=request.args.get("output"),
+        "artlogic/artlogic.html", title=TITLE, form=form, output=output
     )
 
 
+@artlogicApp.route("/artlogic/convert")
+def convert():
+    """
+    Encode/decode the "input" query parameter and return the output as plain text.
+    Since the same input always gives the same output, the response can be cached
+    anywhere along the way.
+    """
+    if "input" not in request.args:
+        abort(400, "Expected an input parameter.")
+
+    _, output = results.get_or_compute(request.args["input"], handleData)
+    return _cacheable_response(output)
+
+
+@artlogicApp.route("/artlogic/result/<result_id>")
+def result(result_id):
+    """
+    Return a previously computed output, by result id, as plain text.
+    """
+    output = results.get(result_id)
+    if output is None:
+        abort(404)
+
+    return _cacheable_response(output)
+
+
+def _cacheable_response(output):
+    """
+    Build a plain text response for the given output, tagged with a hash of the
+    output so that clients can revalidate it with If-None-Match. Returns a Response.
+    """
+    response = Response(output, mimetype="text/plain")
+    response.set_etag(hashlib.sha256(output.encode("utf-8", "surrogatepass")).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = RESULT_MAX_AGE
+    return response.make_conditional(request)
+
+
+@artlogicApp.route("/artlogic/api", methods=["POST"])
+def api():
+    """
+    Encode/decode many inputs at once, for machine clients. Takes a JSON array of
+    strings, or a newline-delimited JSON (NDJSON) body with one string per line,
+    and streams back one JSON object per line, in the same order, holding either
+    the "output" handleData() gives for that input or an "error".
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        # The body is read a line at a time as the response is streamed, so
+        # neither has to be held in memory all at once.
+        items = _read_ndjson(request.stream)
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            abort(400, "Expected a JSON array of strings.")
+
+    return Response(
+        stream_with_context(_api_results(items)), mimetype=NDJSON_MIMETYPES[0]
+    )
+
+
+def _read_ndjson(stream):
+    """
+    Read one JSON document from each non-blank line of the stream. Lines that
+    aren't valid JSON are read as None. Returns a generator.
+    """
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def _api_results(items):
+    """
+    Handle each input for the API. Returns a generator of NDJSON lines.
+    """
+    for item in items:
+        if isinstance(item, str):
+            # The response has already started by now, so a bad input gets an error
+            # of its own rather than cutting the rest of the results off.
+            try:
+                result = {"output": handleData(item)}
+            except ValueError:
+                result = {"error": "Couldn't encode or decode that string."}
+        else:
+            result = {"error": "Expected a JSON string."}
+        yield json.dumps(result) + "\n"
+
+
 def handleData(data):
     """
     Determine if the data is integers or a string, and encode/decode it.
     Returns a string.
     """
-    # Determine if the data is a list of integers by attempting to coerce
-    # it to the integer type.
-    try:
-        encoded_ints = []
-        for item in data.split(" "):
-            encoded_ints.append(int(item))
-        # If this completes without exceptions, we know the data is a list
-        # of integers, and we can decode them.
-        return encode.decode(encoded_ints)
-
-    # If coercing the data to an integer throws an exception, then we know
-    # it's a string, and we can encode it.
-    except ValueError:
-        encoded_ints = encode.encode(data)
-
-        # If the string was over 4 characters, it was encoded into more than
-        # one integer, so we need to join them into a string for display.
-        if len(encoded_ints) > 1:
-            int_strings = [str(item) for item in encoded_ints]
-            result = " ".join(int_strings)
-        else:
-            # If it's only one integer, we can display it as is.
-            result = str(encoded_ints[0])
+    # Determine if the data is a list of integers (separated by any whitespace)
+    # by parsing it all at once.
+    encoded_ints = encode.parse_integers(data)
+    if encoded_ints is not None:
+        # If the data is a list of integers, we can decode them. If any of them is
+        # too big to decode, the data can only be a string after all.
+        try:
+            return encode.decode_many(encoded_ints)
+        except ValueError:
+            pass
+
+    # If the data isn't a list of integers that we can decode, then we know it's a
+    # string, and we can encode it.
+    encoded_ints = encode.encode(data)
 
-        return result
+    # If the string was over 4 characters, it was encoded into more than
+    # one integer, so we need to join them into a string for display.
+    # (An empty string encodes into no integers at all, and displays as an
+    # empty string.)
+    int_strings = [str(item) for item in encoded_ints]
+    return " ".join(int_strings)
@@ -0,0 +1,85 @@
+import collections
+import hashlib
+import threading
+
+
+class ResultCache(object):
+    """
+    A bounded least-recently-used cache of results, keyed by a hash of the input
+    each result was computed from. It holds at most max_size results, taking up at
+    most max_bytes between them, and won't hold any result over max_result_bytes at
+    all. Safe to share between threads.
+    """
+
+    def __init__(self, max_size, max_bytes=None, max_result_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_result_bytes = max_result_bytes
+        self._results = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._results
+
+    @property
+    def size_in_bytes(self):
+        return self._bytes
+
+    @staticmethod
+    def key_for(data):
+        """
+        Hash the given input string into the key its result is stored under.
+        Returns a string of 32 hex digits.
+        """
+        return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+    def get(self, key, default=None):
+        """
+        Return the result stored under key (marking it as recently used), or
+        default if there isn't one.
+        """
+        with self._lock:
+            if key not in self._results:
+                return default
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def put(self, key, result):
+        """
+        Store a result under key, evicting the least recently used results until the
+        cache is within its bounds. Returns False if the result is too big to keep.
+        """
+        size = len(result)
+        if self.max_result_bytes is not None and size > self.max_result_bytes:
+            return False
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._results:
+                self._bytes -= len(self._results.pop(key))
+            self._results[key] = result
+            self._bytes += size
+            while len(self._results) > self.max_size or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._bytes -= len(self._results.popitem(last=False)[1])
+        return True
+
+    def get_or_compute(self, data, compute):
+        """
+        Return the key and result for the given input, only calling compute(data)
+        if the result isn't already cached. Returns a (key, result) tuple.
+        """
+        key = self.key_for(data)
+        missing = object()
+        result = self.get(key, missing)
+        if result is missing:
+            result = compute(data)
+            self.put(key, result)
+        return key, result
@@ -1,23 +1,333 @@
 import sys
+import argparse
+import functools
+import mmap
+import os
+import string
+import struct
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
 
 MAX_LENGTH = 4
 BIT_SHIFT = 4
 
+# The number of differently configured codecs (and sets of compiled lookup tables)
+# to keep around at once.
+CODEC_CACHE_SIZE = 32
+
+# Inputs with at least this many chunks are encoded/decoded with the NumPy batch
+# functions. Below it, building the arrays costs more than a plain loop.
+BATCH_THRESHOLD = 64
+
+# The packed binary format for encoded integers: a 16-byte header followed by the
+# integers as little-endian unsigned words of 8 * bit_shift bits each. The header
+# holds a magic number, the format version, the codec's max_length and bit_shift,
+# a padding byte, and the number of words.
+PACKED_MAGIC = b"ALPK"
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct("<4sBBBxQ")
+
+# How many bytes the command line reads from its input at a time.
+STREAM_BLOCK_SIZE = 1 << 20
+
+# Inputs smaller than this many bytes are never split across processes, since
+# starting the process pool would take longer than encoding them in one process.
+PARALLEL_THRESHOLD = 32 << 20
+
+# The bytes a list of unsigned decimal integers is made of. Signs are allowed too,
+# but handled separately.
+INTEGER_LIST_BYTES = (string.digits + string.whitespace).encode()
+
+
+class InterleaveCodec(object):
+    """
+    Encodes strings into integers (and back) according to the scheme in the
+    specification, generalized to any chunk size. Each chunk of up to max_length
+    bytes has its bytes' bits distributed along an integer of 8 * bit_shift bits at
+    bit_shift length intervals. The specification's scheme is max_length=4,
+    bit_shift=4 (32-bit integers), but 8 bytes in 64-bit integers (8, 8) or 2 bytes
+    in 16-bit integers (2, 2) work the same way.
+
+    Use get_codec() rather than creating these directly, so that the lookup tables
+    for each configuration are only compiled once.
+    """
+
+    def __init__(self, max_length=MAX_LENGTH, bit_shift=BIT_SHIFT):
+        # Integers are stored in NumPy arrays for the batch functions, so the word
+        # size has to be one NumPy has an unsigned integer type for.
+        if bit_shift not in (1, 2, 4, 8):
+            raise ValueError("The bit shift must be 1, 2, 4, or 8.")
+        if not 1 <= max_length <= bit_shift:
+            raise ValueError("Can only fit 1-{} bytes in each integer.".format(bit_shift))
+
+        self.max_length = max_length
+        self.bit_shift = bit_shift
+        self.word_bits = 8 * bit_shift
+        self.word_dtype = np.dtype("<u{}".format(bit_shift))
+
+        self.spread_table, self.gather_tables = _compile_tables(bit_shift)
+        # The spread table shifted along to each byte position in a chunk.
+        self.lane_tables = [
+            [spread << i for spread in self.spread_table] for i in range(max_length)
+        ]
+        self.spread_array = np.array(self.spread_table, dtype=self.word_dtype)
+        self.gather_arrays = np.array(self.gather_tables, dtype=self.word_dtype)
+
+    def __repr__(self):
+        return "{}(max_length={}, bit_shift={})".format(
+            type(self).__name__, self.max_length, self.bit_shift
+        )
+
+    def encode(self, string):
+        """
+        Encode the given string into a list of integers. The string is encoded as
+        UTF-8 and split into chunks of max_length bytes, so characters of any width
+        round-trip through decode(). Returns a list of integers.
+        """
+        # We're using the default encoding of UTF-8 because it matches the examples
+        # given in the specification.
+        return self.encode_bytes(string.encode())
+
+    def encode_bytes(self, data):
+        """
+        Encode a bytes-like object (bytes, bytearray, or memoryview) into a list of
+        integers, max_length bytes per integer. Returns a list of integers.
+        """
+        view = memoryview(data).cast("B")
+        if len(view) >= BATCH_THRESHOLD * self.max_length:
+            return self.encode_many(view).tolist()
+
+        lane_tables = self.lane_tables
+        integers = []
+
+        # Slicing a memoryview doesn't copy, so each chunk is read straight out of
+        # the original buffer.
+        for start in range(0, len(view), self.max_length):
+            result = 0
+            for table, byte in zip(lane_tables, view[start : start + self.max_length]):
+                result |= table[byte]
+            integers.append(result)
+
+        return integers
+
+    def encode_chunk(self, string):
+        """
+        Encode a 0-max_length character string into an integer. Returns an integer.
+        """
+        if len(string) > self.max_length:
+            raise ValueError(
+                "Can only encode strings of 0-{} characters.".format(self.max_length)
+            )
+
+        # Get a byte array from the given string.
+        # We're using the default encoding of UTF-8 because it matches the examples
+        # given in the specification.
+        byte_values = string.encode()
+
+        # Look up each byte with its bits already distributed at bit_shift length
+        # intervals, then move it along the result to its position in the chunk.
+        result = 0
+        for i, byte in enumerate(byte_values):
+            result |= self.spread_table[byte] << i
+
+        return result
+
+    def decode(self, integers):
+        """
+        Decode the given list of integers into a string. The decoded bytes are read
+        as UTF-8 where they're valid UTF-8, or one character per byte otherwise.
+        Returns a string.
+        """
+        return bytes_to_text(self.decode_bytes(integers))
+
+    def decode_bytes(self, integers):
+        """
+        Decode the given list of integers into the bytes they encode, ignoring empty
+        bytes. Returns bytes.
+        """
+        if not hasattr(integers, "__len__"):
+            integers = list(integers)
+        if len(integers) >= BATCH_THRESHOLD:
+            return self._decode_array(integers)
+
+        return self._decode_loop(integers)
+
+    def _decode_loop(self, integers):
+        """
+        Decode the given integers into bytes one at a time. Returns bytes.
+        """
+        # Each integer represents a 0-max_length byte chunk of the original input.
+        decoded = bytearray()
+        for integer in integers:
+            decoded += self._gather(integer).to_bytes(self.bit_shift, byteorder="little")
+
+        return bytes(decoded.replace(b"\0", b""))
+
+    def decode_chunk(self, integer):
+        """
+        Decode the given integer into a max_length character string, one character
+        per byte. Returns a string.
+        """
+        # Get a byte array from the decoded integer. We're reversing the byte order
+        # because we read the input integer from lowest-order bit to highest-order.
+        decoded_bytes = self._gather(integer).to_bytes(self.bit_shift, byteorder="little")
+
+        # Get the characters represented by each byte, ignoring empty bytes.
+        chars = []
+        for byte in decoded_bytes:
+            if byte:
+                chars.append(chr(byte))
+
+        return "".join(chars)
+
+    def _gather(self, integer):
+        """
+        Gather the bits of the given integer back into the integer made of its
+        chunk's bytes, lowest-order byte first. Returns an integer.
+        """
+        if integer.bit_length() > self.word_bits:
+            raise ValueError("Can only decode {}-bit integers.".format(self.word_bits))
+
+        # Negative integers only have their lowest bit_length() bits read.
+        if integer < 0:
+            integer &= (1 << integer.bit_length()) - 1
+
+        # Each byte of the input holds bits of every output byte, so we can look
+        # up its contribution to the decoded integer one byte at a time.
+        decoded_int = 0
+        for i, table in enumerate(self.gather_tables):
+            decoded_int |= table[(integer >> (8 * i)) & 0xFF]
+
+        return decoded_int
+
+    def encode_many(self, data):
+        """
+        Encode a bytes-like buffer (bytes, bytearray, memoryview, or a NumPy array
+        such as uint32 words) into integers, working on the whole buffer at once.
+        Gives the same integers as encode() does for the same bytes. Returns a NumPy
+        array of unsigned integers.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+
+        byte_values = np.frombuffer(data, dtype=np.uint8)
+
+        # Pad the final chunk with empty bytes, which encode to nothing, so that
+        # every chunk is exactly max_length bytes long.
+        padding = -len(byte_values) % self.max_length
+        if padding:
+            byte_values = np.concatenate((byte_values, np.zeros(padding, dtype=np.uint8)))
+        chunks = byte_values.reshape(-1, self.max_length)
+
+        # Spread each byte of every chunk along the result at bit_shift intervals,
+        # starting at the bit matching the byte's position in the chunk.
+        result = np.zeros(len(chunks), dtype=self.word_dtype)
+        for i in range(self.max_length):
+            result |= self.spread_array[chunks[:, i]] << i
+
+        return result
+
+    def decode_many(self, integers):
+        """
+        Decode a sequence or NumPy array of integers into a string, working on the
+        whole array at once. Gives the same string as decode() for the same
+        integers. Returns a string.
+        """
+        return bytes_to_text(self._decode_array(integers))
+
+    def _decode_array(self, integers):
+        """
+        Decode a sequence or NumPy array of integers into the bytes they encode,
+        ignoring empty bytes. Returns bytes.
+        """
+        integers = np.asarray(integers)
+        if not integers.size:
+            return b""
+        if integers.dtype.kind not in "ui" or integers.max() > (1 << self.word_bits) - 1:
+            raise ValueError("Can only decode {}-bit integers.".format(self.word_bits))
+        # Negative integers are read differently (see _gather()), so leave them to
+        # the loop.
+        if integers.min() < 0:
+            return self._decode_loop(integers.tolist())
+        # Packed (and memory-mapped) words are already the right type, so they're
+        # used as they are rather than copied.
+        words = integers.astype(self.word_dtype, copy=False)
+
+        byte_values = self.gather_many(words).view(np.uint8)
+        return byte_values[byte_values != 0].tobytes()
+
+    def gather_many(self, words):
+        """
+        Gather the bits of every word in a NumPy array back into the words made of
+        their chunks' bytes, lowest-order byte first. Returns a NumPy array.
+        """
+        # Gather the bits at bit_shift intervals back into whole bytes, one byte of
+        # every word at a time.
+        decoded = np.zeros(len(words), dtype=self.word_dtype)
+        for i, table in enumerate(self.gather_arrays):
+            decoded |= table[(words >> (8 * i)) & 0xFF]
+
+        return decoded
+
+
+def get_codec(max_length=MAX_LENGTH, bit_shift=BIT_SHIFT):
+    """
+    Get the codec for the given chunk size, creating it (and compiling its lookup
+    tables) only the first time it's asked for. Returns an InterleaveCodec.
+    """
+    return _cached_codec(max_length, bit_shift)
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
+def _cached_codec(max_length, bit_shift):
+    """
+    Create the codec for the given chunk size. Cached by get_codec() so that
+    positional and keyword calls share one codec per configuration.
+    """
+    return InterleaveCodec(max_length, bit_shift)
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
+def _compile_tables(bit_shift):
+    """
+    Build the lookup tables for encoding and decoding with the given bit shift.
+
+    The spread table maps a byte to its bits distributed at bit_shift intervals (bit
+    n moves to bit n * bit_shift). Gather table i maps the value of byte i of an
+    encoded integer to the bits it contributes to the decoded integer: input bit n
+    belongs to output byte n % bit_shift, at position n // bit_shift within that byte.
+    Returns the spread table and a tuple of gather tables.
+    """
+    spread_table = tuple(
+        sum(((byte >> n) & 1) << (n * bit_shift) for n in range(8)) for byte in range(256)
+    )
+    gather_tables = tuple(
+        tuple(
+            sum(
+                ((byte >> n) & 1)
+                << (8 * ((8 * i + n) % bit_shift) + (8 * i + n) // bit_shift)
+                for n in range(8)
+            )
+            for byte in range(256)
+        )
+        for i in range(bit_shift)
+    )
+    return spread_table, gather_tables
+
+
+# The codec described by the specification: up to 4 bytes in each 32-bit integer.
+DEFAULT_CODEC = get_codec(MAX_LENGTH, BIT_SHIFT)
+
 
 def encode(string):
     """
     Encode the given string into a list of 32-bit integers according to the
     scheme in the specification. Returns a list of 32-bit integers.
     """
-    integers = []
-
-    # Break the string into chunks of MAX_LENGTH characters or less, then
-    # encode each chunk.
-    for str_chunk in chunk(string, MAX_LENGTH):
-        integers.append(_encode(str_chunk))
-
-    return integers
+    return DEFAULT_CODEC.encode(string)
 
 
 def _encode(string):
@@ -25,90 +335,204 @@ def _encode(string):
     Encode a 0-MAX_LENGTH character string into a 32-bit integer according to
     the scheme in the specification. Returns a 32-bit integer.
     """
-    if len(string) > MAX_LENGTH:
-        raise ValueError("Can only encode strings of 0-{} characters.".format(MAX_LENGTH))
+    return DEFAULT_CODEC.encode_chunk(string)
 
-    # Get a byte array from the given string.
-    # We're using the default encoding of UTF-8 because it matches the examples
-    # given in the specification.
-    byte_values = string.encode()
 
-    # Take each byte and distribute its bits along the 32-bit result at
-    # BIT_SHIFT length intervals.
-    result = 0
-    for i in range(len(byte_values)):
-        current_byte = byte_values[i]
-        bit_pos = i
+def decode(integers):
+    """
+    Decode the given list of 32-bit integers into a string according to the
+    scheme in the specification. Returns a string.
+    """
+    return DEFAULT_CODEC.decode(integers)
 
-        while current_byte:
-            # Get the lowest-order bit from the current byte.
-            current_bit = current_byte & 1
-            # If the current bit is 1, set the corresponding bit in the result.
-            # Otherwise, we can leave the result bit as 0.
-            if current_bit:
-                result = setBit(result, bit_pos)
 
-            # Shift the lowest-order bit off the end.
-            current_byte >>= 1
-            # Move BIT_SHIFT bits along the result.
-            bit_pos += BIT_SHIFT
+def _decode(integer):
+    """
+    Decode the given 32-bit integer into a MAX_LENGTH character string according
+    to the scheme in the specification. Returns a string.
+    """
+    return DEFAULT_CODEC.decode_chunk(integer)
 
-    return result
 
+def encode_many(data):
+    """
+    Encode a bytes-like buffer into 32-bit integers, working on the whole buffer at
+    once. Gives the same integers as encode() does for the same bytes. Returns a
+    NumPy uint32 array.
+    """
+    return DEFAULT_CODEC.encode_many(data)
 
-def decode(integers):
+
+def decode_many(integers):
     """
-    Decode the given list of 32-bit integers into a string according to the
-    scheme in the specification. Returns a string.
+    Decode a sequence or NumPy array of 32-bit integers into a string, working on
+    the whole array at once. Gives the same string as decode() for the same
+    integers. Returns a string.
     """
-    string_chunks = []
+    return DEFAULT_CODEC.decode_many(integers)
 
-    # Each 32-bit integer represents a 0-MAX_LENGTH character chunk of the
-    # original input string.
-    for integer in integers:
-        string_chunks.append(_decode(integer))
 
-    return "".join(string_chunks)
+def encode_bytes(data):
+    """
+    Encode a bytes-like object into a list of 32-bit integers, 4 bytes per integer.
+    Returns a list of 32-bit integers.
+    """
+    return DEFAULT_CODEC.encode_bytes(data)
 
 
-def _decode(integer):
+def decode_bytes(integers):
     """
-    Decode the given 32-bit integer into a MAX_LENGTH character string according
-    to the scheme in the specification. Returns a string.
+    Decode the given list of 32-bit integers into the bytes they encode, ignoring
+    empty bytes. Returns bytes.
+    """
+    return DEFAULT_CODEC.decode_bytes(integers)
+
+
+def bytes_to_text(data):
+    """
+    Convert decoded bytes into a string: as UTF-8 if they're valid UTF-8 (which
+    everything encode() produces is), otherwise one character per byte. Returns a
+    string.
+    """
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def parse_integers(text):
+    """
+    Parse a string of decimal integers separated by any amount of any whitespace,
+    checking and converting the whole string in one pass. Returns a NumPy int64
+    array, or None if the string isn't a list of integers (or has integers too big
+    to fit in 64 bits).
+    """
+    try:
+        data = text.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+
+    # Whatever is left once the digits and whitespace are removed tells us whether
+    # this can be a list of integers at all, without reading it token by token.
+    leftover = data.translate(None, INTEGER_LIST_BYTES)
+    if not data.strip() or leftover.strip(b"+-"):
+        return None
+
+    if leftover:
+        # Signs can be misplaced ("1-2"), so signed lists are checked one integer
+        # at a time. They're rare enough that this doesn't need to be fast.
+        try:
+            return np.array([int(token) for token in data.split()], dtype=np.int64)
+        except (ValueError, OverflowError):
+            return None
+
+    # Integers too big for 64 bits are read as the largest 64-bit integer.
+    integers = np.fromstring(data, dtype=np.int64, sep=" ")
+    if integers.max() == np.iinfo(np.int64).max:
+        return None
+    return integers
+
+
+def pack(integers, codec=DEFAULT_CODEC):
+    """
+    Pack the given integers (a list or NumPy array encoded with codec) into the
+    packed binary format. Returns bytes.
+    """
+    words = _packed_words(integers, codec)
+    header = _packed_header(len(words), codec)
+    return header + words.tobytes()
+
+
+def write_packed(integers, file, codec=DEFAULT_CODEC):
+    """
+    Write the given integers (a list or NumPy array encoded with codec) to a file in
+    the packed binary format. file can be a path or a binary file object. Returns
+    the number of integers written.
+    """
+    words = _packed_words(integers, codec)
+    header = _packed_header(len(words), codec)
+
+    if hasattr(file, "write"):
+        file.write(header)
+        file.write(words.data)
+    else:
+        with open(file, "wb") as f:
+            f.write(header)
+            f.write(words.data)
+
+    return len(words)
+
+
+def read_packed(buffer):
+    """
+    Read integers in the packed binary format from a bytes-like object, without
+    copying them. Returns the codec they were encoded with and a read-only NumPy
+    array of the integers.
     """
-    if integer.bit_length() > 32:
-        raise ValueError("Can only decode 32-bit integers.")
+    if len(buffer) < PACKED_HEADER.size:
+        raise ValueError("Packed data is too short to have a header.")
 
-    decoded_int = 0
+    magic, version, max_length, bit_shift, count = PACKED_HEADER.unpack_from(buffer)
+    if magic != PACKED_MAGIC:
+        raise ValueError("Not packed artlogic data.")
+    if version != PACKED_VERSION:
+        raise ValueError("Unsupported packed format version {}.".format(version))
 
-    # Since each byte has its bits distributed along the given integer at
-    # BIT_SHIFT intervals, we'll get the bits from one byte at a time.
-    for input_start in range(4):
-        # Move to the beginning of the correct output byte.
-        output_pos = input_start * 8
+    codec = get_codec(max_length, bit_shift)
+    if len(buffer) < PACKED_HEADER.size + count * codec.bit_shift:
+        raise ValueError("Packed data is shorter than its header says.")
 
-        # Read the bits from the input at BIT_SHIFT intervals, lowest-order
-        # bits first.
-        for input_bit in range(input_start, integer.bit_length(), BIT_SHIFT):
-            current_bit = getBit(integer, input_bit)
-            # If the current bit is 1, set the corresponding bit in the result.
-            # Otherwise, we can leave the result bit as 0.
-            if current_bit:
-                decoded_int = setBit(decoded_int, output_pos)
-            # Move to the next position in the output byte.
-            output_pos += 1
+    words = np.frombuffer(
+        buffer, dtype=codec.word_dtype, count=count, offset=PACKED_HEADER.size
+    )
+    return codec, words
 
-    # Get a byte array from the decoded integer. We're reversing the byte order
-    # because we read the input integer from lowest-order bit to highest-order.
-    decoded_bytes = decoded_int.to_bytes(4, byteorder="little")
 
-    # Get the characters represented by each byte, ignoring empty bytes.
-    chars = []
-    for byte in decoded_bytes:
-        if byte:
-            chars.append(chr(byte))
+def load_packed(path):
+    """
+    Memory-map a file in the packed binary format, so its integers are read straight
+    from the file as they're used. Returns the codec they were encoded with and a
+    read-only NumPy array of the integers.
+    """
+    with open(path, "rb") as f:
+        # The map stays open for as long as the returned array refers to it.
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return read_packed(mapped)
+
 
-    return "".join(chars)
+def decode_packed(path):
+    """
+    Decode a file in the packed binary format without loading its integers into
+    Python ints first. Returns a string.
+    """
+    codec, words = load_packed(path)
+    return codec.decode_many(words)
+
+
+def _packed_header(count, codec):
+    """
+    Build the header for count integers encoded with codec. Returns bytes.
+    """
+    return PACKED_HEADER.pack(
+        PACKED_MAGIC, PACKED_VERSION, codec.max_length, codec.bit_shift, count
+    )
+
+
+def _packed_words(integers, codec):
+    """
+    Convert the given integers into the little-endian word array stored in the
+    packed binary format. Returns a NumPy array.
+    """
+    integers = np.asarray(integers)
+    if integers.size and (
+        integers.dtype.kind not in "ui"
+        or integers.min() < 0
+        or integers.max() > (1 << codec.word_bits) - 1
+    ):
+        raise ValueError("Can only pack {}-bit integers.".format(codec.word_bits))
+
+    return np.ascontiguousarray(integers, dtype=codec.word_dtype)
 
 
 def getBit(num, n):
@@ -136,6 +560,290 @@ def chunk(string, n):
         yield string[i : i + n]
 
 
+def encode_parallel(data, codec=DEFAULT_CODEC, processes=None):
+    """
+    Encode a bytes-like buffer the same way as encode_many(), split into segments
+    that are encoded by a pool of processes. The input and the result are passed
+    through shared memory rather than pickled. Inputs under PARALLEL_THRESHOLD bytes
+    are encoded in this process instead. Returns a NumPy array of unsigned integers.
+    """
+    view = memoryview(data).cast("B")
+    processes = processes or os.cpu_count() or 1
+    if len(view) < PARALLEL_THRESHOLD or processes < 2:
+        return codec.encode_many(view)
+
+    word_count = -(-len(view) // codec.max_length)
+    source = shared_memory.SharedMemory(create=True, size=len(view))
+    result = shared_memory.SharedMemory(create=True, size=word_count * codec.bit_shift)
+    try:
+        source.buf[: len(view)] = view
+        _run_segments(
+            _encode_segment,
+            processes,
+            word_count,
+            source.name,
+            len(view),
+            result.name,
+            codec.max_length,
+            codec.bit_shift,
+        )
+        return np.ndarray(word_count, dtype=codec.word_dtype, buffer=result.buf).copy()
+    finally:
+        _release(source)
+        _release(result)
+
+
+def decode_parallel(integers, codec=DEFAULT_CODEC, processes=None):
+    """
+    Decode an array of integers the same way as decode_many(), split into segments
+    that are decoded by a pool of processes. The integers and the decoded bytes are
+    passed through shared memory rather than pickled. Inputs under
+    PARALLEL_THRESHOLD bytes are decoded in this process instead. Returns a string.
+    """
+    integers = np.asarray(integers)
+    processes = processes or os.cpu_count() or 1
+    if (
+        integers.size * codec.bit_shift < PARALLEL_THRESHOLD
+        or processes < 2
+        or integers.dtype.kind not in "ui"
+        or integers.min() < 0
+        or integers.max() > (1 << codec.word_bits) - 1
+    ):
+        # decode_many() takes care of (or complains about) anything unusual.
+        return codec.decode_many(integers)
+
+    size = integers.size * codec.bit_shift
+    source = shared_memory.SharedMemory(create=True, size=size)
+    result = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        words = np.ndarray(integers.size, dtype=codec.word_dtype, buffer=source.buf)
+        words[:] = integers
+        del words
+        _run_segments(
+            _decode_segment,
+            processes,
+            integers.size,
+            source.name,
+            size,
+            result.name,
+            codec.max_length,
+            codec.bit_shift,
+        )
+        byte_values = np.ndarray(size, dtype=np.uint8, buffer=result.buf)
+        decoded = byte_values[byte_values != 0].tobytes()
+        del byte_values
+        return bytes_to_text(decoded)
+    finally:
+        _release(source)
+        _release(result)
+
+
+def _run_segments(worker, processes, word_count, *args):
+    """
+    Split word_count words into one segment per process and run the worker on each
+    segment in a process pool, waiting for them all to finish.
+    """
+    bounds = [word_count * i // processes for i in range(processes + 1)]
+    with ProcessPoolExecutor(processes) as pool:
+        jobs = [
+            pool.submit(worker, start, end, *args)
+            for start, end in zip(bounds, bounds[1:])
+            if end > start
+        ]
+        for job in jobs:
+            job.result()
+
+
+def _encode_segment(start, end, source_name, source_size, result_name, *codec_args):
+    """
+    Encode words start to end of the input in the shared memory named source_name
+    into the same words of the shared memory named result_name. Runs in a worker
+    process.
+    """
+    codec = get_codec(*codec_args)
+    source = shared_memory.SharedMemory(name=source_name)
+    result = shared_memory.SharedMemory(name=result_name)
+    try:
+        data = source.buf[
+            start * codec.max_length : min(end * codec.max_length, source_size)
+        ]
+        words = np.ndarray(
+            end - start,
+            dtype=codec.word_dtype,
+            buffer=result.buf,
+            offset=start * codec.bit_shift,
+        )
+        words[:] = codec.encode_many(data)
+        del words
+        data.release()
+    finally:
+        source.close()
+        result.close()
+
+
+def _decode_segment(start, end, source_name, source_size, result_name, *codec_args):
+    """
+    Gather words start to end of the integers in the shared memory named source_name
+    into the same words of the shared memory named result_name. Runs in a worker
+    process.
+    """
+    codec = get_codec(*codec_args)
+    source = shared_memory.SharedMemory(name=source_name)
+    result = shared_memory.SharedMemory(name=result_name)
+    try:
+        offset = start * codec.bit_shift
+        words = np.ndarray(
+            end - start, codec.word_dtype, buffer=source.buf, offset=offset
+        )
+        decoded = np.ndarray(
+            end - start, codec.word_dtype, buffer=result.buf, offset=offset
+        )
+        decoded[:] = codec.gather_many(words)
+        del words, decoded
+    finally:
+        source.close()
+        result.close()
+
+
+def _release(memory):
+    """
+    Close and remove shared memory created by this process.
+    """
+    memory.close()
+    memory.unlink()
+
+
+def read_blocks(file, block_size=STREAM_BLOCK_SIZE):
+    """
+    Read a binary file object in blocks of up to block_size bytes. Returns a
+    generator of bytes.
+    """
+    while True:
+        block = file.read(block_size)
+        if not block:
+            return
+        yield block
+
+
+def encode_blocks(blocks, codec=DEFAULT_CODEC):
+    """
+    Encode a stream of byte blocks into space-separated decimal integers, the same
+    text a whole-input encode would give. Bytes that don't fill a whole chunk are
+    held back until the next block (or the end), so blocks of any size line up with
+    the chunking. Returns a generator of bytes.
+    """
+    leftover = b""
+    separator = b""
+
+    for block in blocks:
+        block = leftover + block
+        aligned = len(block) - len(block) % codec.max_length
+        leftover = block[aligned:]
+        if aligned:
+            yield separator + _format_integers(codec.encode_many(block[:aligned]))
+            separator = b" "
+
+    if leftover:
+        yield separator + _format_integers(codec.encode_many(leftover))
+
+
+def decode_blocks(blocks, codec=DEFAULT_CODEC):
+    """
+    Decode a stream of blocks of whitespace-separated decimal integers into the
+    bytes they encode. A number split across two blocks is held back until the rest
+    of it arrives. Returns a generator of bytes.
+    """
+    leftover = b""
+
+    for block in blocks:
+        block = leftover + block
+        # Anything after the last whitespace might be the start of a longer number.
+        split_at = max(block.rfind(space) for space in b" \t\n\r\f\v")
+        leftover = block[split_at + 1 :]
+        integers = [int(token) for token in block[: split_at + 1].split()]
+        if integers:
+            yield codec.decode_bytes(integers)
+
+    if leftover.strip():
+        yield codec.decode_bytes([int(token) for token in leftover.split()])
+
+
+def _format_integers(integers):
+    """
+    Format an array of integers as space-separated decimal text. Returns bytes.
+    """
+    return " ".join(map(str, integers.tolist())).encode()
+
+
+def main(argv=None):
+    """
+    Encode or decode a file (or stdin) from the command line, a block at a time, so
+    memory use stays the same however large the input is.
+    """
+    parser = argparse.ArgumentParser(
+        description="Encode text into integers, or decode integers into text, "
+        "according to the Art & Logic specification."
+    )
+    parser.add_argument("command", choices=["encode", "decode"])
+    parser.add_argument(
+        "input", nargs="?", default="-", help="the file to read (default: stdin)"
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="the file to write (default: stdout)"
+    )
+    parser.add_argument(
+        "-b",
+        "--block-size",
+        type=int,
+        default=STREAM_BLOCK_SIZE,
+        help="how many bytes to read at a time",
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="report throughput on stderr when done"
+    )
+    args = parser.parse_args(argv)
+
+    if args.block_size < 1:
+        parser.error("the block size must be at least 1 byte")
+
+    infile = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    outfile = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    stages = {"encode": encode_blocks, "decode": decode_blocks}
+
+    bytes_read = 0
+
+    def counted(blocks):
+        nonlocal bytes_read
+        for block in blocks:
+            bytes_read += len(block)
+            yield block
+
+    start = time.perf_counter()
+    try:
+        blocks = counted(read_blocks(infile, args.block_size))
+        for result in stages[args.command](blocks):
+            outfile.write(result)
+        if args.command == "encode":
+            outfile.write(b"\n")
+        outfile.flush()
+    finally:
+        if infile is not sys.stdin.buffer:
+            infile.close()
+        if outfile is not sys.stdout.buffer:
+            outfile.close()
+
+    if args.stats:
+        elapsed = time.perf_counter() - start
+        print(
+            "{}d {} bytes in {:.3f}s ({:.2f} MB/s)".format(
+                args.command,
+                bytes_read,
+                elapsed,
+                bytes_read / elapsed / 1e6 if elapsed else 0,
+            ),
+            file=sys.stderr,
+        )
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        print(encode(sys.argv[1]))
+    main()
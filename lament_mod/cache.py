@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+
+# A cache of filled sheets, keyed by a hash of what was filled in. Lots of sheets come
+# out exactly the same - every level 1 Cleric gets the same spell list, and every Elf
+# just gets Read Magic - so there's no point filling them again (especially not with
+# pdftk, which means starting a whole process).
+#
+# There are two tiers, both least-recently-used: a small one in memory, and an
+# optional bigger one on disk, which is shared by every process (and survives restarts).
+# Only one thread fills any given sheet at a time - if a few requests want the same
+# sheet at once, the first one fills it and the rest wait for it.
+
+# The most bytes of sheets to keep in memory, per process.
+MEMORY_BYTES = int(os.environ.get("LAMENT_SHEET_CACHE_MEMORY", 16 << 20))
+
+# Where to keep sheets on disk, and how many bytes of them. Without a directory, the
+# cache only uses memory.
+DISK_DIRECTORY = os.environ.get("LAMENT_SHEET_CACHE_DIRECTORY")
+DISK_BYTES = int(os.environ.get("LAMENT_SHEET_CACHE_DISK", 256 << 20))
+
+CACHE_EXTENSION = ".sheet"
+
+
+def sheet_key(template_path, values, filler="builtin"):
+    """
+    Hash everything that goes into a filled sheet: the template, the values (a
+    dictionary of field names to values), and what filled it.
+    """
+    canonical = json.dumps(
+        [filler, os.path.basename(template_path), values],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class SheetCache(object):
+    """
+    A two-tier LRU cache of filled sheets, as bytes.
+
+    :param memory_bytes: The most bytes to keep in memory.
+    :param directory: Where to keep sheets on disk, or None to only use memory.
+    :param disk_bytes: The most bytes to keep on disk.
+    """
+
+    def __init__(
+        self, memory_bytes=MEMORY_BYTES, directory=DISK_DIRECTORY, disk_bytes=DISK_BYTES
+    ):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory = collections.OrderedDict()
+        self.memory_size = 0
+        # Keys being filled right now, to Futures for their sheets.
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, fill):
+        """
+        Return the sheet for key, calling fill() to make it (and caching the result)
+        if it isn't cached already. fill() must return bytes.
+        """
+        with self.lock:
+            sheet = self._memory_get(key)
+            if sheet is not None:
+                return sheet
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Future()
+
+        if not leader:
+            # Someone else is already filling this sheet.
+            return flight.result()
+
+        try:
+            sheet = self._disk_get(key)
+            if sheet is None:
+                sheet = fill()
+                self._disk_put(key, sheet)
+            with self.lock:
+                self._memory_put(key, sheet)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(sheet)
+        finally:
+            with self.lock:
+                del self.flights[key]
+        return sheet
+
+    def __len__(self):
+        with self.lock:
+            return len(self.memory)
+
+    def _memory_get(self, key):
+        sheet = self.memory.get(key)
+        if sheet is not None:
+            self.memory.move_to_end(key)
+        return sheet
+
+    def _memory_put(self, key, sheet):
+        if len(sheet) > self.memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key))
+        self.memory[key] = sheet
+        self.memory_size += len(sheet)
+        while self.memory_size > self.memory_bytes:
+            self.memory_size -= len(self.memory.popitem(last=False)[1])
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def _disk_get(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                sheet = f.read()
+            # A file's modification time is when it was last used, for eviction.
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        return sheet
+
+    def _disk_put(self, key, sheet):
+        if self.directory is None or len(sheet) > self.disk_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first, so nobody ever reads half a sheet.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(sheet)
+        os.replace(temp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used sheets on disk until they fit in disk_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_EXTENSION):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                # Another process got to it first.
+                pass
+            total -= size
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory=DISK_DIRECTORY):
+    """Return the process-wide SheetCache for directory."""
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = SheetCache(directory=directory)
+        return _caches[directory]
@@ -33,6 +33,9 @@ HIT_DICE = {
     CharClass.HALFLING: 6,
 }
 
+# Magic-Users (and ONLY Magic-Users) have a different hit die at first level.
+MAGIC_USER_FIRST_HIT_DIE = 6
+
 HIT_BONUSES = {
     CharClass.CLERIC: 2,
     CharClass.FIGHTER: 3,
@@ -151,9 +154,18 @@ SKILL_POINTS_TO_SPEND = "You have {} skill points to spend."
 
 class LotFPCharacter(object):
     def __init__(
-        self, desired_class=None, desired_level=1, calculate_encumbrance=True, counter=1
+        self,
+        desired_class=None,
+        desired_level=1,
+        calculate_encumbrance=True,
+        counter=1,
+        details=None,
     ):
-        self.details = tools.fetch_character(desired_class)
+        # The details can be handed in if they've already been fetched (say, all at
+        # once for a whole party). Otherwise we'll fetch them ourselves.
+        if details is None:
+            details = tools.fetch_character(desired_class)
+        self.details = details
         # self.pcClass = self.details['class']
         self.pcClass = CLASS_MAP[self.details["class"].casefold()]
         self.level = desired_level
@@ -289,7 +301,7 @@ class LotFPCharacter(object):
             # ...account for the irritating fact that Magic-Users (and ONLY Magic-Users)
             # have a d6 hit die at first level and a d4 at 2nd level and up...
             if self.pcClass is CharClass.MAGIC_USER:
-                hit_die = 6
+                hit_die = MAGIC_USER_FIRST_HIT_DIE
             # ...then add the final roll for level 1 or the minimum HP for the class,
             # whichever is higher.
             hp += max(
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+
+import gzip
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import lament_mod.generator as generator
+import lament_mod.upstream as upstream
+
+# An on-disk collection of characters from the remote generator, so Lament can run
+# without it. Each character is stored gzipped, in a directory named for its class,
+# in a file named for the SHA-256 of its contents - so recording the same character
+# twice only stores it once:
+#
+#   LamentCorpus/Halfling/3f1c...e9.json.gz
+#
+# The class comes from the remote generator, so only the classes we know about
+# (generator.CLASSES) are stored - anything else could point the path anywhere.
+
+# Where the corpus lives. By default it's in the working directory, rather than in the
+# package, so recording doesn't write into the source tree.
+CORPUS_DIRECTORY = os.environ.get(
+    "LAMENT_CORPUS_DIRECTORY", os.path.abspath("LamentCorpus")
+)
+
+CORPUS_EXTENSION = ".json.gz"
+
+
+class EmptyCorpus(upstream.UpstreamUnavailable):
+    """There's nothing in the corpus to replay (at least, not of the wanted class)."""
+
+
+def character_hash(details):
+    """Hash the details in a canonical form, so the same character always matches."""
+    canonical = json.dumps(details, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class Corpus(object):
+    """
+    A directory of recorded characters. The index of which files exist is read the
+    first time it's needed, and kept up to date as characters are recorded.
+    """
+
+    def __init__(self, directory=CORPUS_DIRECTORY):
+        self.directory = directory
+        self.index = None
+        self.lock = threading.Lock()
+
+    def _load_index(self):
+        if self.index is None:
+            index = {}
+            if os.path.isdir(self.directory):
+                for pc_class in os.listdir(self.directory):
+                    if pc_class not in generator.CLASSES:
+                        continue
+                    class_directory = os.path.join(self.directory, pc_class)
+                    if os.path.isdir(class_directory):
+                        index[pc_class] = sorted(
+                            name[: -len(CORPUS_EXTENSION)]
+                            for name in os.listdir(class_directory)
+                            if name.endswith(CORPUS_EXTENSION)
+                        )
+            self.index = index
+        return self.index
+
+    def _path(self, pc_class, digest):
+        return os.path.join(self.directory, pc_class, digest + CORPUS_EXTENSION)
+
+    def record(self, details):
+        """
+        Store a character in the corpus, unless it's already there. Returns its hash,
+        or None if it isn't one of the classes we know about (so it isn't stored).
+        """
+        pc_class = details.get("class")
+        if pc_class not in generator.CLASSES:
+            return None
+        digest = character_hash(details)
+        path = self._path(pc_class, digest)
+
+        with self.lock:
+            index = self._load_index()
+            if digest in index.get(pc_class, []):
+                return digest
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = gzip.compress(json.dumps(details).encode(), mtime=0)
+            # Write to a temporary file first, so nobody ever replays half a character.
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+            index.setdefault(pc_class, []).append(digest)
+        return digest
+
+    def load(self, pc_class, digest):
+        with gzip.open(self._path(pc_class, digest), "rt", encoding="utf8") as f:
+            return json.load(f)
+
+    def choice(self, pc_class=None, rng=random):
+        """
+        Return a random recorded character, of the given class if there is one.
+
+        :raises EmptyCorpus: if there aren't any characters to choose from.
+        """
+        with self.lock:
+            index = self._load_index()
+            if pc_class:
+                candidates = [(pc_class, digest) for digest in index.get(pc_class, [])]
+            else:
+                candidates = [
+                    (c, digest) for c, digests in index.items() for digest in digests
+                ]
+
+        if not candidates:
+            raise EmptyCorpus(
+                "There are no recorded {}characters.".format(
+                    pc_class + " " if pc_class else ""
+                )
+            )
+        # Each choice is a fresh load, so callers are free to mangle what they get.
+        return self.load(*rng.choice(candidates))
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(digests) for digests in self._load_index().values())
+
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def get_corpus(directory=CORPUS_DIRECTORY):
+    """Return the process-wide Corpus for directory."""
+    with _corpora_lock:
+        if directory not in _corpora:
+            _corpora[directory] = Corpus(directory)
+        return _corpora[directory]
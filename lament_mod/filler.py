@@ -0,0 +1,382 @@
+#!/usr/bin/python
+
+import functools
+import io
+import re
+import struct
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, createStringObject
+import lament_mod.render as render
+
+# Fills (and flattens) the form fields of the fillable PDFs without pdftk. Each
+# template is parsed once, and filling a sheet just draws the field values as text
+# where the fields were, over the template's artwork (without the fields themselves).
+
+# Times-Roman's ascent and descent, in thousandths of the font size.
+FONT_ASCENT = 683
+FONT_DESCENT = -217
+
+# Character widths (in thousandths of the font size) for printable ASCII, from the
+# standard Times-Roman metrics. Anything else is assumed to be DEFAULT_WIDTH.
+CHARACTER_WIDTHS = dict(
+    zip(
+        " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`"
+        "abcdefghijklmnopqrstuvwxyz{|}~",
+        [
+            250, 333, 408, 500, 500, 833, 778, 333, 333, 333, 500, 564, 250, 333, 250,
+            278, 500, 500, 500, 500, 500, 500, 500, 500, 500, 500, 278, 278, 564, 564,
+            564, 444, 921, 722, 667, 667, 722, 611, 556, 722, 722, 333, 389, 722, 611,
+            889, 722, 722, 556, 722, 667, 556, 611, 722, 722, 944, 722, 722, 611, 333,
+            278, 333, 469, 500, 333, 444, 500, 444, 500, 444, 333, 500, 500, 278, 278,
+            500, 278, 778, 500, 500, 500, 500, 333, 389, 278, 500, 500, 722, 500, 500,
+            444, 480, 200, 480, 541,
+        ],
+    )
+)  # fmt: skip
+DEFAULT_WIDTH = 500
+
+# The gap between a field's border and its text, in points.
+PADDING = 2
+# The distance between lines of multiline fields, as a multiple of the font size.
+LEADING = 1.15
+# Used when a field doesn't say what size its text is (or says 0, meaning "auto").
+DEFAULT_FONT_SIZE = 12
+
+# Field flag bit for multiline text fields.
+MULTILINE = 1 << 12
+
+FONT_SIZE = re.compile(r"([\d.]+)\s+Tf")
+
+
+class Field(object):
+    """The position and look of one text field on a template page."""
+
+    def __init__(self, name, page, rect, font_size, alignment=0, multiline=False):
+        self.name = name
+        self.page = page
+        self.x0, self.y0, self.x1, self.y1 = rect
+        self.font_size = font_size
+        self.alignment = alignment
+        self.multiline = multiline
+
+    @property
+    def width(self):
+        return self.x1 - self.x0
+
+    @property
+    def height(self):
+        return self.y1 - self.y0
+
+
+def text_width(text, font_size):
+    return sum(CHARACTER_WIDTHS.get(c, DEFAULT_WIDTH) for c in text) * font_size / 1000
+
+
+def wrap(text, width, font_size):
+    """Split text into lines no wider than width, breaking at spaces where it can."""
+    lines = []
+    for paragraph in str(text).splitlines() or [""]:
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = word if not line else line + " " + word
+            if line and text_width(candidate, font_size) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def escape(text):
+    """Encode text as the body of a PDF string literal, in WinAnsi (cp1252)."""
+    encoded = text.encode("cp1252", errors="replace")
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def format_number(number):
+    return ("%.3f" % number).rstrip("0").rstrip(".").encode()
+
+
+def draw_field(field, value):
+    """Return the content stream operators that draw value inside field."""
+    size = field.font_size
+    if field.multiline:
+        lines = wrap(value, field.width - 2 * PADDING, size)
+        # The first line hangs from the top of the field.
+        y = field.y1 - PADDING - FONT_ASCENT * size / 1000
+    else:
+        lines = [str(value).replace("\n", " ")]
+        # A single line is centered vertically.
+        text_height = (FONT_ASCENT - FONT_DESCENT) * size / 1000
+        y = field.y0 + (field.height - text_height) / 2 - FONT_DESCENT * size / 1000
+
+    # Clip to the field, so overlong values don't scribble over the rest of the sheet.
+    operators = [
+        b"q",
+        b" ".join(
+            format_number(n) for n in (field.x0, field.y0, field.width, field.height)
+        )
+        + b" re W n",
+        b"BT",
+        render.FONT_NAME.encode() + b" " + format_number(size) + b" Tf",
+    ]
+    for line in lines:
+        x = field.x0 + PADDING
+        if field.alignment:
+            spare = field.width - 2 * PADDING - text_width(line, size)
+            # 1 is centered, 2 is right-aligned.
+            x += spare / 2 if field.alignment == 1 else spare
+        operators.append(
+            b"1 0 0 1 "
+            + format_number(x)
+            + b" "
+            + format_number(y)
+            + b" Tm ("
+            + escape(line)
+            + b") Tj"
+        )
+        y -= size * LEADING
+    operators.extend([b"ET", b"Q"])
+    return b"\n".join(operators)
+
+
+class FormTemplate(object):
+    """
+    A fillable PDF, parsed once and then filled as many times as you like. Parsing
+    works out where each field is and serializes the template's artwork (see
+    render.py), so filling only has to draw the values.
+
+    :param path: The path to the fillable PDF.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            reader = PdfFileReader(io.BytesIO(f.read()), strict=False)
+        pages = [reader.getPage(i) for i in range(reader.getNumPages())]
+        self.page_count = len(pages)
+        self.fields = self._read_fields(pages)
+        self.background = render.Background(pages)
+        # What each page draws underneath its fields: (background, page number) pairs.
+        self.pages = [(self.background, i) for i in range(self.page_count)]
+
+    @staticmethod
+    def _read_fields(pages):
+        fields = {}
+        for page_number, page in enumerate(pages):
+            annotations = page.get("/Annots")
+            for annotation in annotations.getObject() if annotations else []:
+                annotation = annotation.getObject()
+                if annotation.get("/FT") != "/Tx" or "/T" not in annotation:
+                    continue
+                match = FONT_SIZE.search(annotation.get("/DA", ""))
+                font_size = float(match.group(1)) if match else 0
+                x0, y0, x1, y1 = [float(n) for n in annotation["/Rect"]]
+                fields[annotation["/T"]] = Field(
+                    annotation["/T"],
+                    page_number,
+                    (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)),
+                    font_size or DEFAULT_FONT_SIZE,
+                    alignment=int(annotation.get("/Q", 0)),
+                    multiline=bool(int(annotation.get("/Ff", 0)) & MULTILINE),
+                )
+        return fields
+
+    def draw(self, values):
+        """
+        Draw values (a dictionary of field names to values) into the template's
+        fields, and return a list of each page's content stream operators. Values for
+        fields the template doesn't have are ignored, as are None and "".
+        """
+        drawn = [[] for i in range(self.page_count)]
+        for name, value in values.items():
+            field = self.fields.get(name)
+            if field is None or value is None or value == "":
+                continue
+            drawn[field.page].append(draw_field(field, value))
+        return [b"\n".join(operators) for operators in drawn]
+
+    def render(self, values, document):
+        """
+        Fill the template's fields with values, adding the filled pages to document
+        (a render.Document).
+        """
+        for page, content in zip(self.pages, self.draw(values)):
+            document.add_page(*page, content)
+
+    def fill(self, values, output):
+        """
+        Fill the template's fields with values and write the flattened PDF to output,
+        a binary file-like object.
+        """
+        document = render.Document()
+        self.render(values, document)
+        document.write(output)
+
+    def fill_bytes(self, values):
+        """Like fill(), but returns the PDF as bytes."""
+        output = io.BytesIO()
+        self.fill(values, output)
+        return output.getvalue()
+
+
+class CombinedTemplate(FormTemplate):
+    """
+    Several templates, one after another, filled as one. Each part's field names are
+    namespaced with its prefix ("Character:class", "Spells:Spell0", ...), and its pages
+    draw the part's own artwork, so a document with both combined and separate sheets
+    in it still only has one copy of each template's artwork.
+
+    :param path: The path to the combined fillable PDF (see write_combined_template()).
+    It isn't read - everything comes from the parts.
+    :param parts: A list of (prefix, path) pairs, one for each part.
+    """
+
+    def __init__(self, path, parts):
+        self.path = path
+        self.fields = {}
+        self.pages = []
+        for prefix, part_path in parts:
+            part = get_template(part_path)
+            for name, field in part.fields.items():
+                name = namespace(prefix, name)
+                self.fields[name] = Field(
+                    name,
+                    field.page + len(self.pages),
+                    (field.x0, field.y0, field.x1, field.y1),
+                    field.font_size,
+                    alignment=field.alignment,
+                    multiline=field.multiline,
+                )
+            self.pages.extend(part.pages)
+        self.page_count = len(self.pages)
+        self.background = None
+
+
+def namespace(prefix, name):
+    """The name a part's field goes by in a combined template."""
+    return "{}:{}".format(prefix, name)
+
+
+# Combined templates' paths, to their parts.
+combined_templates = {}
+
+
+def register_combined_template(path, parts):
+    """
+    Say that the fillable PDF at path is the given parts (a list of (prefix, path)
+    pairs) combined, so get_template() builds it from them. Has to happen before
+    anything asks for it.
+    """
+    combined_templates[path] = tuple(parts)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(path):
+    """Return the FormTemplate for path, parsing it the first time it's asked for."""
+    if path in combined_templates:
+        return CombinedTemplate(path, combined_templates[path])
+    return FormTemplate(path)
+
+
+def write_combined_template(parts, output):
+    """
+    Write a fillable PDF of the parts (a list of (prefix, path) pairs) one after
+    another to output, a binary file-like object, with each part's fields renamed
+    with its prefix. This is for filling the parts all at once with pdftk; filling
+    in-process doesn't need it (see CombinedTemplate).
+    """
+    writer = PdfFileWriter()
+    fields = ArrayObject()
+    resources = None
+
+    for prefix, path in parts:
+        with open(path, "rb") as f:
+            reader = PdfFileReader(io.BytesIO(f.read()), strict=False)
+        form = reader.trailer["/Root"]["/AcroForm"].getObject()
+        if resources is None:
+            resources = form.get("/DR")
+
+        for page_number in range(reader.getNumPages()):
+            page = reader.getPage(page_number)
+            writer.addPage(page)
+            page_reference = writer._pages.getObject()["/Kids"][-1]
+
+            annotations = page.get("/Annots")
+            for reference in annotations.getObject() if annotations else []:
+                annotation = reference.getObject()
+                # Point the widgets at their new page, or the writer would copy the
+                # old one (and everything it leads to) along with them.
+                annotation[NameObject("/P")] = page_reference
+                if "/T" in annotation:
+                    annotation[NameObject("/T")] = createStringObject(
+                        namespace(prefix, annotation["/T"])
+                    )
+                    fields.append(reference)
+
+    form = DictionaryObject({NameObject("/Fields"): fields})
+    if resources is not None:
+        form[NameObject("/DR")] = resources
+    writer._root_object[NameObject("/AcroForm")] = writer._addObject(form)
+    writer.write(output)
+
+
+class FilledSheet(object):
+    """
+    A filled template, kept as just the text drawn on each of its pages. It's small
+    enough to send back from a fill process, and adding it to a document doesn't copy
+    the template's artwork.
+
+    :param template_path: The path to the fillable PDF that was filled.
+    :param contents: Each page's content stream operators, from FormTemplate.draw().
+    """
+
+    def __init__(self, template_path, contents):
+        self.template_path = template_path
+        self.contents = contents
+
+    def pages(self):
+        """
+        Return the sheet's pages, as the (background, page_number, content) tuples
+        render.Document.add_page() and render.stream() take.
+        """
+        template = get_template(self.template_path)
+        return [
+            (background, page_number, content)
+            for (background, page_number), content in zip(template.pages, self.contents)
+        ]
+
+    def add_to(self, document):
+        """Add the sheet's pages to document (a render.Document)."""
+        for page in self.pages():
+            document.add_page(*page)
+
+    def dumps(self):
+        """Return the sheet's page contents packed into bytes, for caching."""
+        return b"".join(
+            struct.pack(">I", len(content)) + content for content in self.contents
+        )
+
+    @classmethod
+    def loads(cls, template_path, data):
+        """Unpack a sheet of the template at template_path from dumps()'s bytes."""
+        contents = []
+        offset = 0
+        while offset < len(data):
+            (length,) = struct.unpack_from(">I", data, offset)
+            offset += 4
+            contents.append(data[offset : offset + length])
+            offset += length
+        return cls(template_path, contents)
+
+    def to_bytes(self):
+        """Return the sheet on its own, as a PDF."""
+        document = render.Document()
+        self.add_to(document)
+        return document.to_bytes()
+
+
+def fill_sheet(template_path, values):
+    """Fill the template at template_path with values, and return the FilledSheet."""
+    return FilledSheet(template_path, get_template(template_path).draw(values))
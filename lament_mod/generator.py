@@ -0,0 +1,269 @@
+#!/usr/bin/python
+
+import csv
+import os
+import random
+import lament_mod.character as character
+
+# A local, in-process stand-in for the remote generator at
+# character.totalpartykill.ca. It rolls first level LotFP characters and returns them
+# in the same JSON shape the remote generator does, so the rest of the code can't tell
+# the difference (except that it doesn't have to wait on the network).
+
+LEVEL_ONE_SPELLS = os.path.join(
+    os.path.dirname(__file__), "Item Lists", "LevelOneSpells.csv"
+)
+
+WEAPONS = os.path.join(os.path.dirname(__file__), "Item Lists", "Weapons.txt")
+
+CLASSES = ["Cleric", "Fighter", "Magic-User", "Specialist", "Dwarf", "Elf", "Halfling"]
+
+ATTRIBUTE_NAMES = ["STR", "INT", "WIS", "DEX", "CON", "CHA"]
+
+# Score ranges and their modifiers, straight from the LotFP rules.
+MODIFIERS = [(3, -3), (5, -2), (8, -1), (12, 0), (15, 1), (17, 2), (18, 3)]
+
+SKILL_NAMES = [
+    "Open Doors",
+    "Search",
+    "Stealth",
+    "Bushcraft",
+    "Languages",
+    "Tinker",
+    "Architecture",
+    "Sleight of Hand",
+    "Climb",
+]
+
+# Demihumans are naturally better at some skills. Everybody else starts at 1 in 6.
+CLASS_SKILLS = {
+    "Dwarf": {"Architecture": 2},
+    "Elf": {"Search": 2},
+    "Halfling": {"Bushcraft": 3, "Stealth": 5},
+}
+
+SPECIALIST_SKILL_POINTS = 4
+
+UNARMORED_AC = 12
+ARMOR_AC = {"Leather Armor": 14, "Chain Armor": 16, "Plate Armor": 18}
+
+# The armor each class is allowed to pick from. Magic-Users don't get any.
+ARMOR = {
+    "Cleric": ["Leather Armor", "Chain Armor"],
+    "Fighter": ["Leather Armor", "Chain Armor", "Plate Armor"],
+    "Magic-User": [],
+    "Specialist": ["Leather Armor"],
+    "Dwarf": ["Chain Armor", "Plate Armor"],
+    "Elf": ["Leather Armor", "Chain Armor"],
+    "Halfling": ["Leather Armor"],
+}
+
+SHIELD_USERS = ["Cleric", "Fighter", "Dwarf", "Elf", "Halfling"]
+
+# Magic-Users can only be trusted with the pointy end of a dagger.
+MAGIC_USER_WEAPONS = ["Dagger"]
+BOWS = ["Shortbow", "Short bow"]
+QUIVER = "Quiver With 20 Arrows"
+
+CLASS_EQUIPMENT = {
+    "Cleric": ["Holy Symbol"],
+    "Magic-User": ["Spellbook"],
+    "Specialist": ["Specialist Tools"],
+}
+
+ADVENTURING_GEAR = [
+    "Backpack",
+    "Sack",
+    "Tinderbox",
+    "3 Torches",
+    "50' Rope",
+    "1 day's Rations",
+    "Chalk",
+    "Soap",
+    "Iron Spike",
+    "Steel Mirror",
+    "Candle",
+    "Whistle",
+]
+
+# Magic-Users always know Read Magic, and get this many other first level spells.
+MAGIC_USER_SPELLS = 2
+# Spells a Magic-User never rolls - they either get them anyway or can't have them.
+EXCLUDED_SPELLS = ["Read Magic", "Summon"]
+
+PERSONALITY_TRAITS = [
+    "Brave",
+    "Cautious",
+    "Cheerful",
+    "Curious",
+    "Faithful",
+    "Greedy",
+    "Grumpy",
+    "Honest",
+    "Lazy",
+    "Nervous",
+    "Pondering",
+    "Proud",
+    "Sassy",
+    "Stubborn",
+    "Superstitious",
+    "Vain",
+]
+
+
+def _read_lines(filename):
+    with open(filename, "r") as f:
+        return f.read().splitlines()
+
+
+def _read_spells(filename):
+    """Read the first level Magic-User spells (the ones before the Cleric spells)."""
+    spells = []
+    with open(filename, encoding="utf8", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row["Spell"] == "One clerical spell a day":
+                break
+            if row["Spell"] not in EXCLUDED_SPELLS:
+                spells.append(row["Spell"])
+    return spells
+
+
+# These are read once, when the module is imported, so generating a character never
+# has to touch the disk.
+WEAPON_CHOICES = [
+    weapon for weapon in _read_lines(WEAPONS) if weapon and weapon not in BOWS
+]
+SPELL_CHOICES = _read_spells(LEVEL_ONE_SPELLS)
+
+
+def roll(dice, sides, rng=random):
+    return sum(rng.randint(1, sides) for _ in range(dice))
+
+
+def get_modifier(score):
+    """Return the LotFP modifier for an attribute score."""
+    for highest, modifier in MODIFIERS:
+        if score <= highest:
+            return modifier
+    return MODIFIERS[-1][1]
+
+
+def format_attribute(score):
+    """Format a score the way the remote generator does, e.g. '14 (+1)' or '9'."""
+    modifier = get_modifier(score)
+    if modifier:
+        return "{} ({:+d})".format(score, modifier)
+    return str(score)
+
+
+def get_skills(pc_class, mods, rng=random):
+    skills = {name: 1 for name in SKILL_NAMES}
+    skills.update(CLASS_SKILLS.get(pc_class, {}))
+    skills["Open Doors"] = max(skills["Open Doors"] + mods["STR"], 1)
+    skills["Languages"] = max(skills["Languages"] + mods["INT"], 0)
+
+    # Specialists spread their skill points around at random.
+    if pc_class == "Specialist":
+        for _ in range(SPECIALIST_SKILL_POINTS):
+            skills[rng.choice(SKILL_NAMES)] += 1
+
+    return [[name, value] for name, value in skills.items()]
+
+
+def get_saves(pc_class, mods):
+    """Level one saves, less the INT (for magic) and WIS (for everything else) mods."""
+    first_level = character.LOTFP_SAVES[character.CLASS_MAP[pc_class.casefold()]][0]
+    saves = {name: int(save) for name, save in zip(character.SAVE_NAMES, first_level)}
+    for save in saves:
+        saves[save] -= mods["INT"] if save == "magic" else mods["WIS"]
+    return saves
+
+
+def get_hp(pc_class, con_mod, rng=random):
+    """First level hit points: a hit die plus CON, or the class's minimum if that's more."""
+    char_class = character.CLASS_MAP[pc_class.casefold()]
+    hit_die = character.HIT_DICE[char_class]
+    if char_class is character.CharClass.MAGIC_USER:
+        hit_die = character.MAGIC_USER_FIRST_HIT_DIE
+    return max(roll(1, hit_die, rng) + con_mod, character.MIN_HP[char_class])
+
+
+def get_equipment(pc_class, rng=random):
+    equipment = []
+
+    armor = rng.choice(ARMOR[pc_class]) if ARMOR[pc_class] else None
+    if armor:
+        equipment.append(armor)
+    shield = pc_class in SHIELD_USERS and rng.random() < 0.5
+    if shield:
+        equipment.append("Shield")
+
+    if pc_class == "Magic-User":
+        equipment.extend(MAGIC_USER_WEAPONS)
+    else:
+        equipment.extend(rng.sample(WEAPON_CHOICES, 2))
+        if rng.random() < 0.5:
+            equipment.extend([rng.choice(BOWS), QUIVER])
+
+    equipment.extend(CLASS_EQUIPMENT.get(pc_class, []))
+    equipment.extend(rng.sample(ADVENTURING_GEAR, rng.randint(4, 8)))
+    # The equipment formatter only understands a single digit of copper.
+    equipment.append("{} Cp".format(roll(1, 9, rng)))
+
+    return equipment, armor, shield
+
+
+def get_ac(armor, shield, dex_mod):
+    """AC includes armor, DEX, and +1 for a shield, just like the remote generator."""
+    return ARMOR_AC.get(armor, UNARMORED_AC) + dex_mod + int(shield)
+
+
+def get_spells(pc_class, rng=random):
+    # Elves and Clerics get their spells assigned later on (see spells.py), so only
+    # Magic-Users need any rolled here.
+    if pc_class != "Magic-User":
+        return None
+    return ["Read Magic"] + rng.sample(SPELL_CHOICES, MAGIC_USER_SPELLS)
+
+
+def generate_character(pc_class=None, rng=random):
+    """
+    Roll up a first level LotFP character, in the same shape as the JSON from the
+    remote generator.
+
+    :param pc_class: The class of the character. Random if not given.
+    :param rng: Where the randomness comes from. Anything with the same methods as
+    the random module will do (e.g. a seeded random.Random).
+    :return: A dictionary of character details.
+    """
+    if pc_class is None:
+        pc_class = rng.choice(CLASSES)
+    if pc_class not in CLASSES:
+        raise ValueError("Unknown character class: {}".format(pc_class))
+
+    # 3d6 in order, as the gods intended.
+    scores = {name: roll(3, 6, rng) for name in ATTRIBUTE_NAMES}
+    mods = {name: get_modifier(score) for name, score in scores.items()}
+
+    equipment, armor, shield = get_equipment(pc_class, rng)
+    hp = get_hp(pc_class, mods["CON"], rng)
+
+    return {
+        "system": "LotFP",
+        "class": pc_class,
+        "level": 1,
+        "attributes": [[name, scores[name]] for name in ATTRIBUTE_NAMES],
+        "attr": {name: format_attribute(score) for name, score in scores.items()},
+        "skills": get_skills(pc_class, mods, rng),
+        "saves": get_saves(pc_class, mods),
+        "equipment": equipment,
+        "ac": get_ac(armor, shield, mods["DEX"]),
+        "hp": hp,
+        "thac9": 10,
+        "to_hit": None,
+        "sneak_attack": 1 if pc_class == "Specialist" else 0,
+        "spell": get_spells(pc_class, rng),
+        "languages": [],
+        "notes": [],
+        "personality": ", ".join(rng.sample(PERSONALITY_TRAITS, 2)),
+    }
@@ -1,17 +1,25 @@
 #!/usr/bin/python
 
-from flask import request, send_file, render_template, flash, url_for, redirect, Blueprint
+from flask import Response, request, render_template, flash, url_for, redirect, Blueprint
 
+import lament_mod.cache as cache
 import lament_mod.character as character
+import lament_mod.filler as filler
+import lament_mod.generator as generator
+import lament_mod.merge as merge
+import lament_mod.render as render
 import lament_mod.tools as tools
 import lament_mod.spells as spells
-from fdfgen import forge_fdf
+import lament_mod.upstream as upstream
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PyPDF2 import PdfFileMerger, PdfFileReader
-import subprocess
+import io
+import itertools
 import os
-import glob
-import tempfile
 import random
+import threading
 
 # Some sass for the title of the page.
 SASS = [
@@ -35,18 +43,47 @@ ERROR_MESSAGES = {
      Uh huh. Lemme get right on that.""",
     "ZERO": """There you go! I generated NO characters for you,
       just like you asked.""",
+    "UPSTREAM": """The character generator is taking a nap.
+     Give it a minute and try again.""",
+    "CLASS": """%s? Never heard of 'em.
+     Pick one of the classes on the buttons.""",
 }
 
 # The path to the blank fillable character sheet PDF.
 FILLABLE_CHARACTER_SHEET = os.path.join(
     os.path.dirname(__file__), "LotFPCharacterSheetLastGaspFillable.pdf"
 )
-# The final directory in which to place the finished PDF, relative to the current
-# working directory.
-FINAL_PDF_DIRECTORY_NAME = "FinalPDF"
+# The character sheet and the spell sheet in one fillable PDF, so a spellcaster's
+# sheets can be filled all at once. Its fields are the two sheets' fields, namespaced
+# with these prefixes. It was made with filler.write_combined_template().
+FILLABLE_CASTER_SHEET = os.path.join(
+    os.path.dirname(__file__), "LotFPCasterSheetFillable.pdf"
+)
+CASTER_SHEET_PARTS = [
+    ("Character", FILLABLE_CHARACTER_SHEET),
+    ("Spells", spells.FILLABLE_SPELL_SHEET),
+]
+filler.register_combined_template(FILLABLE_CASTER_SHEET, CASTER_SHEET_PARTS)
 
 # Whether or not to calculate encumbrance values for the generated characters.
 CALCULATE_ENCUMBRANCE = True
+# Whether to fill spellcasters' character and spell sheets in one go, with the caster
+# sheet, when their spell sheet isn't already cached. Otherwise the spell sheet is
+# always filled separately. Either way, cached spell sheets are used.
+COMBINE_CASTER_SHEETS = os.environ.get("LAMENT_COMBINE_CASTER_SHEETS", "1") != "0"
+
+# The most character details to fetch at once for a single request.
+MAX_CONCURRENT_FETCHES = 8
+# How many app workers share the machine: WEB_CONCURRENCY is how many gunicorn starts,
+# when it's set. Without it there's no telling, so assume there's one per CPU.
+WEB_WORKERS = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+# How many processes fill sheets in parallel, for each app worker. One means sheets
+# are filled in the request's own process, one after another. By default each worker
+# gets its share of the machine's CPUs, rather than every worker starting a fill
+# process per CPU.
+FILL_PROCESSES = int(
+    os.environ.get("LAMENT_FILL_PROCESSES", max(1, (os.cpu_count() or 1) // WEB_WORKERS))
+)
 
 # The request argument containing the desired level of character.
 REQUEST_ARG_LEVEL = "desired_level"
@@ -58,6 +95,23 @@ REQUEST_ARG_NUM_CHARS = "randos"
 lamentApp = Blueprint("lament", __name__)
 
 
+@lamentApp.record_once
+def load_templates(state):
+    """
+    Parse the fillable PDFs when the app starts up, rather than making the first
+    request wait for it.
+    """
+    if tools.PDF_FILLER != "pdftk":
+        get_templates()
+
+
+def get_templates():
+    """Parse the fillable PDFs the sheets are filled from, if they haven't been already."""
+    filler.get_template(FILLABLE_CHARACTER_SHEET)
+    filler.get_template(spells.FILLABLE_SPELL_SHEET)
+    filler.get_template(FILLABLE_CASTER_SHEET)
+
+
 # @lamentApp.route('/')
 @lamentApp.route("/character")
 def index():
@@ -71,7 +125,9 @@ def index():
 def lament_pdf():
     """
     Generate the desired number of characters using the desired class and level data
-    from the request.
+    from the request. Nothing is written to disk - the merged PDF is streamed to the
+    response as its sheets are filled, so every request has its own output and nobody
+    has to wait for the whole party before it starts.
     """
     try:
         desired_level, desired_class, number = handle_input(request.form)
@@ -89,30 +145,34 @@ def lament_pdf():
         flash(message)
         return redirect(url_for("lament.index"))
 
-    # We'll use a temporary directory to hold the individual generated PDFs before
-    # we merge them into the final document.
-    tmpdir = tempfile.TemporaryDirectory(dir=os.getcwd())
+    if desired_class is not None and desired_class not in generator.CLASSES:
+        # Only the classes on the buttons can be generated (or fetched).
+        flash(ERROR_MESSAGES["CLASS"] % desired_class)
+        return redirect(url_for("lament.index"))
 
     # Grab character data from the API and fill it into individual character sheets.
-    generate_individual_chars(number, tmpdir, desired_class, desired_level)
+    try:
+        sheets = generate_individual_chars(number, desired_class, desired_level)
+    except upstream.UpstreamUnavailable:
+        flash(ERROR_MESSAGES["UPSTREAM"])
+        return redirect(url_for("lament.index"))
 
     if desired_class:
-        final_name = os.path.join("FinalPDF", desired_class + ".pdf")
+        final_name = desired_class + ".pdf"
     else:
-        final_name = os.path.join("FinalPDF", str(number) + "Characters.pdf")
-
-    # Create a directory for the final PDF, deleting any conflicting PDFs.
-    prep_directory(final_name)
-
-    # Merge all the individual PDFs into one final PDF.
-    mergePDFs(tmpdir.name, final_name)
-
-    return send_file(
-        final_name,
-        mimetype="application/pdf",
-        as_attachment=True,
-        attachment_filename=final_name,
+        final_name = str(number) + "Characters.pdf"
+
+    # Merge all the individual sheets into one final PDF, as they're filled. The first
+    # sheet is filled (and with pdftk, every sheet is merged) before the response
+    # starts: once the PDF has started going out, a failed fill can only cut it short,
+    # rather than getting an error page.
+    sheets = iter(sheets)
+    chunks = mergePDFs(itertools.chain([next(sheets)], sheets))
+    response = Response(
+        itertools.chain([next(chunks)], chunks), mimetype="application/pdf"
     )
+    response.headers.set("Content-Disposition", "attachment", filename=final_name)
+    return response
 
 
 def handle_input(form):
@@ -161,96 +221,241 @@ def handle_error(number, is_type_error=False):
     return message
 
 
-def generate_individual_chars(num_characters, temp_directory, char_class, char_level):
+def fetch_party(num_characters, char_class):
     """
-    Generate individual character sheets and fill their form fields with data. Writes
-    them to the given temporary directory.
+    Fetch the details for num_characters characters at once, rather than waiting on
+    them one at a time. The details come back in a list, in the order they were asked
+    for.
     """
-    for i in range(num_characters):
-        if char_class:
-            PC = character.LotFPCharacter(
-                char_class,
-                char_level,
-                calculate_encumbrance=CALCULATE_ENCUMBRANCE,
-                counter=i,
-            )
-        else:
-            PC = character.LotFPCharacter(
-                desired_class=None,
-                desired_level=char_level,
-                calculate_encumbrance=CALCULATE_ENCUMBRANCE,
-                counter=i,
-            )
-
-        # If the character has spells, create a PDF spell sheet and fill
-        # it with spells and spell info.
+    if num_characters <= 1:
+        return [tools.fetch_character(char_class) for i in range(num_characters)]
+
+    workers = min(num_characters, MAX_CONCURRENT_FETCHES)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(tools.fetch_character, [char_class] * num_characters))
+
+
+def generate_individual_chars(num_characters, char_class, char_level):
+    """
+    Generate individual character sheets and fill their form fields with data. Returns
+    an iterator of the filled sheets, in the order they go in the final PDF. The
+    details are all fetched before this returns, but the sheets are filled as the
+    iterator gets to them.
+    """
+    party = fetch_party(num_characters, char_class)
+    fills = get_fills(party, char_class, char_level)
+
+    if FILL_PROCESSES <= 1 or len(fills) <= 1:
+        results = (fill(*args) for fill, args in fills)
+    else:
+        # The fills don't depend on each other, so they can all happen at once. Waiting
+        # on the results in order keeps the sheets in order.
+        pool, futures = submit_fills(fills)
+        results = (
+            fill_result(pool, future, fill, args)
+            for future, (fill, args) in zip(futures, fills)
+        )
+
+    # Some fills return a list of sheets, rather than just the one.
+    return (
+        sheet
+        for result in results
+        for sheet in (result if isinstance(result, list) else [result])
+    )
+
+
+def get_fills(party, char_class, char_level):
+    """
+    Build the characters for a party's details, and return a list of the sheet fills
+    they need, as (function, arguments) pairs, in the order the sheets go in the final
+    PDF. Each fill returns its sheet (or a list of sheets), and they can be run in any
+    order (or all at once).
+    """
+    fills = []
+    for i, details in enumerate(party):
+        PC = build_character(details, i, char_class, char_level)
+
+        # If the character has spells, they need a spell sheet with their spells and
+        # spell info, too - filled along with their character sheet if it isn't cached.
+        if PC.is_spellcaster() and COMBINE_CASTER_SHEETS:
+            fills.append((fill_caster_sheet, (PC,)))
+            continue
+
+        fills.append((fill_sheet, (PC,)))
         if PC.is_spellcaster():
-            spells.create_spellsheet_pdf(
-                PC.details, PC.name, filename=None, directory=temp_directory.name
-            )
+            fills.append((spells.create_spellsheet_pdf, (PC.details,)))
+    return fills
 
-        # Create fdf data files to fill PDF form fields
-        fdf_data = forge_fdf("", PC.details, [], [], [])
 
-        with open(os.path.join(temp_directory.name, PC.fdf_name), "wb") as f:
-            f.write(fdf_data)
+def build_character(details, counter, char_class, char_level):
+    return character.LotFPCharacter(
+        char_class,
+        char_level,
+        calculate_encumbrance=CALCULATE_ENCUMBRANCE,
+        counter=counter,
+        details=details,
+    )
+
 
-        run_pdftk(PC, temp_directory.name)
+_fill_pool = None
+_fill_pool_lock = threading.Lock()
 
 
-def run_pdftk(character, tempdir_name):
+def get_fill_pool():
     """
-    Run pdftk as a subprocess, filling the form fields of the PDFs with FDF data and
-    storing the resulting PDFs in the given temporary directory.
+    Return the process pool for filling sheets, starting it the first time. The
+    processes stick around between requests, so they only have to load the templates
+    once (or not at all, if they're forked after the app has loaded them).
     """
-    path_to_pdftk = tools.get_pdftk_path()
+    global _fill_pool
+    with _fill_pool_lock:
+        if _fill_pool is None:
+            _fill_pool = ProcessPoolExecutor(max_workers=FILL_PROCESSES)
+        return _fill_pool
 
-    # All of the command-line arguments for PDFtk,
-    # since they were getting kinda long.
-    args = [
-        path_to_pdftk,
-        FILLABLE_CHARACTER_SHEET,
-        "fill_form",
-        character.fdf_name,
-        "output",
-        character.filled_name,
-        "flatten",
-    ]
 
-    # Fill the forms with PDFtk, store them in the tempfiles directory.
-    subprocess.run(args, cwd=tempdir_name, **tools.subprocess_args(False))
+def replace_fill_pool(broken):
+    """
+    Drop a fill pool that's broken (one of its processes died, which takes the whole
+    pool down with it), so the next get_fill_pool() starts a new one.
+    """
+    global _fill_pool
+    with _fill_pool_lock:
+        if _fill_pool is broken:
+            _fill_pool = None
+    broken.shutdown(wait=False)
+
+
+def submit_fills(fills):
+    """
+    Submit fills (see get_fills()) to the fill pool. Returns the pool and the fills'
+    futures, in order. A broken pool is replaced first.
+    """
+    pool = get_fill_pool()
+    try:
+        return pool, [pool.submit(fill, *args) for fill, args in fills]
+    except BrokenProcessPool:
+        replace_fill_pool(pool)
+        pool = get_fill_pool()
+        return pool, [pool.submit(fill, *args) for fill, args in fills]
 
 
-def prep_directory(final_PDF_name):
+def fill_result(pool, future, fill, args):
     """
-    Create a directory on disk for the final PDF. If the directory already exists,
-    it will be cleared of any PDFs with a conflicting name.
+    Return the sheet a fill submitted to pool made. If the pool broke before it was
+    done, it's replaced for the next request, and the sheet is filled here instead.
     """
     try:
-        os.mkdir(FINAL_PDF_DIRECTORY_NAME)
-    except FileExistsError:
-        # If the directory already exists, all we need to do is remove any PDFs with
-        # conflicting names.
-        pass
+        return future.result()
+    except BrokenProcessPool:
+        replace_fill_pool(pool)
+        return fill(*args)
 
-    # Remove any conflicting final PDFs.
-    if os.path.exists(final_PDF_name):
-        os.remove(final_PDF_name)
 
+def fill_sheet(character):
+    """
+    Fill the character's sheet with their details, and return it. The sheet is filled
+    in-process (returning a filler.FilledSheet), unless tools.PDF_FILLER says to use
+    pdftk (returning the PDF's bytes).
+    """
+    if tools.PDF_FILLER == "pdftk":
+        return tools.fill_with_pdftk(FILLABLE_CHARACTER_SHEET, character.details)
+    return filler.fill_sheet(FILLABLE_CHARACTER_SHEET, character.details)
 
-def mergePDFs(tempdir_name, final_PDF_name):
+
+def fill_caster_sheet(character):
     """
-    Merge all files ending in .pdf in the given temporary directory into a single
-    PDF. Writes the final PDF back into the given temporary directory.
+    Fill a spellcaster's character sheet and spell sheet, and return them. Like
+    fill_sheet(), this uses pdftk if tools.PDF_FILLER says to.
+
+    Lots of casters share a spell sheet, so if theirs is already in the spell sheet
+    cache (see spells.create_spellsheet_pdf()), only the character sheet is filled.
+    Otherwise both are filled together, as one sheet (see FILLABLE_CASTER_SHEET), and
+    the spell sheet's pages are cached for the next caster. Either way, that's one
+    fill (and with pdftk, one process) per caster. Like any other spell sheet, only
+    one caster fills it at a time - the rest wait for it, then fill their own
+    character sheet.
     """
-    merger = PdfFileMerger()
-    PDFs_to_be_merged = glob.glob(os.path.join(tempdir_name, "*.pdf"))
+    details = character.details
+    spell_fields = spells.get_spellsheet_fields(details)
+    character_pages = template_page_count(FILLABLE_CHARACTER_SHEET)
+    pdftk = tools.PDF_FILLER == "pdftk"
+    # The caster sheet, if this caster filled the spell sheet along with it.
+    combined = []
+
+    def fill_combined():
+        fields = caster_sheet_fields(details, spell_fields)
+        if pdftk:
+            combined.append(tools.fill_with_pdftk(FILLABLE_CASTER_SHEET, fields))
+            # The spell sheet is the pages after the character sheet's.
+            merger = merge.Merger()
+            merger.append(combined[0], start=character_pages)
+            return merger.to_bytes()
+        combined.append(filler.fill_sheet(FILLABLE_CASTER_SHEET, fields))
+        spell_contents = combined[0].contents[character_pages:]
+        return filler.FilledSheet(spells.FILLABLE_SPELL_SHEET, spell_contents).dumps()
+
+    spell_sheet = cache.get_cache().get(
+        spells.spellsheet_key(spell_fields), fill_combined
+    )
+    if combined:
+        return combined[0]
 
-    # Sort the PDFs so they show up in the correct order in the final document.
-    PDFs_to_be_merged.sort()
+    if pdftk:
+        # Two whole PDFs - generate_individual_chars() passes them both along.
+        return [tools.fill_with_pdftk(FILLABLE_CHARACTER_SHEET, details), spell_sheet]
+    # The caster sheet's pages are the character sheet's, then the spell sheet's.
+    contents = filler.get_template(FILLABLE_CHARACTER_SHEET).draw(details)
+    contents += filler.FilledSheet.loads(
+        spells.FILLABLE_SPELL_SHEET, spell_sheet
+    ).contents
+    return filler.FilledSheet(FILLABLE_CASTER_SHEET, contents)
 
-    for PDF in PDFs_to_be_merged:
-        with open(PDF, "rb"):
-            merger.append(PdfFileReader(PDF))
 
-    merger.write(final_PDF_name)
+def caster_sheet_fields(details, spell_fields):
+    """
+    Return the caster sheet's form fields for a character, as a dictionary, from their
+    details and their spell sheet's fields (from spells.get_spellsheet_fields()).
+    """
+    (character_prefix, _), (spells_prefix, _) = CASTER_SHEET_PARTS
+    fields = {
+        filler.namespace(character_prefix, name): value for name, value in details.items()
+    }
+    for name, value in spell_fields.items():
+        fields[filler.namespace(spells_prefix, name)] = value
+    return fields
+
+
+@functools.lru_cache(maxsize=None)
+def template_page_count(path):
+    """The number of pages in the fillable PDF at path."""
+    with open(path, "rb") as f:
+        return PdfFileReader(f, strict=False).getNumPages()
+
+
+def mergePDFs(sheets):
+    """
+    Merge the filled sheets (an iterable, in order) into a single PDF, yielding its
+    bytes as it goes. Sheets filled in-process are filler.FilledSheets, which are
+    written out as they arrive, sharing their templates' artwork. Sheets filled by
+    pdftk are whole PDFs (as bytes), so those are merged first (see tools.PDF_MERGER)
+    and written in one go.
+    """
+    if tools.PDF_FILLER != "pdftk":
+        # Load the templates before the document starts, so none of their artwork
+        # gets numbered while it's being written.
+        get_templates()
+        yield from render.stream(page for sheet in sheets for page in sheet.pages())
+        return
+
+    if tools.PDF_MERGER == "pypdf2":
+        merger = PdfFileMerger()
+        for sheet in sheets:
+            merger.append(PdfFileReader(io.BytesIO(sheet)))
+    else:
+        merger = merge.Merger()
+        for sheet in sheets:
+            merger.append(sheet)
+    final_PDF = io.BytesIO()
+    merger.write(final_PDF)
+    yield final_PDF.getvalue()
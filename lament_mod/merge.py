@@ -0,0 +1,216 @@
+#!/usr/bin/python
+
+import hashlib
+import io
+import zlib
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import DictionaryObject, IndirectObject, NameObject, StreamObject
+import lament_mod.render as render
+
+# Merges whole PDFs (like the sheets pdftk fills) into one, much smaller, PDF.
+#
+# Every sheet pdftk fills is a complete copy of its template - fonts, images, artwork
+# and all - so gluing them together page by page (like PyPDF2's PdfFileMerger does)
+# stores all of that once per sheet. Instead, every object the pages use is copied
+# with its references renumbered, and identified by the hash of the result, so an
+# object that's the same in every sheet (which is nearly all of them) is only stored
+# once. The small objects that are left (dictionaries, arrays and so on) are packed
+# into compressed object streams, with a cross-reference stream to find them, rather
+# than being written out as plain text.
+
+# The most objects to pack into one object stream.
+OBJECTS_PER_STREAM = 100
+
+# Byte widths of the cross-reference stream's fields: type, offset (or object stream
+# number), and generation (or index in the object stream).
+XREF_WIDTHS = (1, 4, 2)
+
+# Page attributes that are left behind. Pages get a new parent, and annotations point
+# back at their pages, which the merged document has no use for once forms are flat.
+DROPPED_PAGE_KEYS = {"/Parent", "/Annots"}
+
+
+class Merger(object):
+    """
+    Merges PDFs into one, storing each distinct object only once.
+
+    Objects 1 and 2 are always the page tree and the catalog.
+    """
+
+    PAGES_NUMBER = 1
+    CATALOG_NUMBER = 2
+
+    def __init__(self):
+        # Object numbers to their bodies. Streams are stored whole ("<< ... >> stream
+        # ... endstream"), everything else is packed into object streams when written.
+        self.bodies = {}
+        self.streams = set()
+        self.hashes = {}
+        self.page_numbers = []
+        self.count = self.CATALOG_NUMBER
+
+    def _allocate(self):
+        self.count += 1
+        return self.count
+
+    def append(self, pdf, start=0):
+        """
+        Add the pages of pdf (a PDF, as bytes) to the end of the merged document,
+        skipping the first start pages.
+        """
+        reader = PdfFileReader(io.BytesIO(pdf), strict=False)
+        # Object numbers in pdf, to their numbers in the merged document.
+        numbers = {}
+        # Objects that turned out to refer (eventually) to themselves, so they had to
+        # be given a number before they could be hashed.
+        fixed = {}
+
+        for i in range(start, reader.getNumPages()):
+            page = reader.getPage(i)
+            number = self._allocate()
+            if page.indirectRef is not None:
+                key = (page.indirectRef.idnum, page.indirectRef.generation)
+                numbers[key] = number
+
+            copy = DictionaryObject()
+            for key, value in page.items():
+                if key not in DROPPED_PAGE_KEYS:
+                    copy[NameObject(key)] = self._copy(value, numbers, fixed)
+            copy[NameObject("/Parent")] = IndirectObject(self.PAGES_NUMBER, 0, None)
+            self.bodies[number] = render.serialize(copy)
+            self.page_numbers.append(number)
+
+    def _copy(self, pdf_object, numbers, fixed):
+        """Copy an object, pointing every reference it makes at merged objects."""
+        return render.copy_object(
+            pdf_object, lambda reference: self._add(reference, numbers, fixed)
+        )
+
+    def _add(self, reference, numbers, fixed):
+        """
+        Add the object a reference points to (and everything it uses), unless an
+        identical object is already there. Returns its number in the merged document.
+        """
+        key = (reference.idnum, reference.generation)
+        if key in numbers:
+            number = numbers[key]
+            if number is None:
+                # We're still copying this object - it refers to itself somewhere.
+                # It needs a number now, and can't be deduplicated.
+                number = fixed.setdefault(key, self._allocate())
+            return number
+
+        numbers[key] = None
+        pdf_object = reference.getObject()
+        body = render.serialize(self._copy(pdf_object, numbers, fixed))
+        is_stream = isinstance(pdf_object, StreamObject)
+
+        if key in fixed:
+            number = fixed[key]
+        else:
+            digest = hashlib.sha256(body).digest()
+            number = self.hashes.get(digest)
+            if number is not None:
+                numbers[key] = number
+                return number
+            number = self._allocate()
+            self.hashes[digest] = number
+
+        self.bodies[number] = body
+        if is_stream:
+            self.streams.add(number)
+        numbers[key] = number
+        return number
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    def write(self, output):
+        """Write the merged document to output, a binary file-like object."""
+        kids = b" ".join(b"%d 0 R" % number for number in self.page_numbers)
+        bodies = dict(self.bodies)
+        bodies[self.PAGES_NUMBER] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            kids,
+            len(self.page_numbers),
+        )
+        bodies[self.CATALOG_NUMBER] = b"<< /Type /Catalog /Pages %d 0 R >>" % (
+            self.PAGES_NUMBER
+        )
+
+        # Object streams and the cross-reference stream are numbered after everything.
+        packed = sorted(number for number in bodies if number not in self.streams)
+        groups = [
+            packed[i : i + OBJECTS_PER_STREAM]
+            for i in range(0, len(packed), OBJECTS_PER_STREAM)
+        ]
+        first_stream = self.count + 1
+        xref_number = first_stream + len(groups)
+        size = xref_number + 1
+
+        # Where to find each object: (type, field 2, field 3), as in the xref stream.
+        entries = {0: (0, 0, 65535)}
+        position = 0
+
+        def emit(data):
+            nonlocal position
+            output.write(data)
+            position += len(data)
+
+        emit(render.PDF_HEADER)
+        for number in sorted(self.streams):
+            entries[number] = (1, position, 0)
+            emit(render.object_body(number, bodies[number]))
+
+        for index, group in enumerate(groups):
+            stream_number = first_stream + index
+            offsets = []
+            data = []
+            offset = 0
+            for place, number in enumerate(group):
+                entries[number] = (2, stream_number, place)
+                offsets.append(b"%d %d" % (number, offset))
+                data.append(bodies[number])
+                offset += len(bodies[number]) + 1
+            header = b" ".join(offsets) + b"\n"
+            compressed = zlib.compress(header + b"\n".join(data) + b"\n")
+            entries[stream_number] = (1, position, 0)
+            emit(
+                render.object_body(
+                    stream_number,
+                    b"<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode "
+                    b"/Length %d >>\nstream\n%s\nendstream"
+                    % (len(group), len(header), len(compressed), compressed),
+                )
+            )
+
+        entries[xref_number] = (1, position, 0)
+        rows = []
+        for number in range(size):
+            fields = entries.get(number, (0, 0, 0))
+            rows.append(
+                b"".join(
+                    value.to_bytes(width, "big")
+                    for value, width in zip(fields, XREF_WIDTHS)
+                )
+            )
+        compressed = zlib.compress(b"".join(rows))
+        emit(
+            render.object_body(
+                xref_number,
+                b"<< /Type /XRef /Size %d /W [%s] /Root %d 0 R /Filter /FlateDecode "
+                b"/Length %d >>\nstream\n%s\nendstream"
+                % (
+                    size,
+                    b" ".join(b"%d" % width for width in XREF_WIDTHS),
+                    self.CATALOG_NUMBER,
+                    len(compressed),
+                    compressed,
+                ),
+            )
+        )
+        emit(b"startxref\n%d\n%%%%EOF\n" % entries[xref_number][1])
+
+    def to_bytes(self):
+        output = io.BytesIO()
+        self.write(output)
+        return output.getvalue()
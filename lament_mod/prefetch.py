@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+import queue
+import threading
+import lament_mod.generator as generator
+import lament_mod.upstream as upstream
+
+# The remote generator can't be asked for a specific class, so getting one means
+# fetching random characters until the right class turns up. Rather than making a
+# request wait for that, a background thread keeps a queue of characters per class
+# topped up, and every character it fetches goes into its own class's queue.
+
+# How many characters to keep on hand for each class.
+DEFAULT_DEPTH = 2
+
+# How long the prefetcher waits before trying again after the upstream fails, in
+# seconds. The upstream client's circuit breaker does most of the work here.
+RETRY_DELAY = 5
+
+
+class CharacterPool(object):
+    """
+    Per-class queues of prefetched characters, kept topped up by a daemon thread.
+
+    :param fetch: A function that returns the details of one random character.
+    :param depths: A dictionary of class names to how many of that class to keep
+    on hand. Classes not in the dictionary get DEFAULT_DEPTH.
+    """
+
+    def __init__(self, fetch, depths=None, default_depth=DEFAULT_DEPTH):
+        depths = depths or {}
+        self.fetch = fetch
+        self.depths = {
+            pc_class: depths.get(pc_class, default_depth)
+            for pc_class in generator.CLASSES
+        }
+        self.queues = {
+            pc_class: queue.Queue(maxsize=depth)
+            for pc_class, depth in self.depths.items()
+        }
+        self.wanted = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the prefetcher thread, if it isn't already running."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped.clear()
+                self.thread = threading.Thread(
+                    target=self._run, name="lament-prefetch", daemon=True
+                )
+                self.thread.start()
+        self.wanted.set()
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.wanted.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def take(self, pc_class):
+        """Return a prefetched character of the given class, or None if there isn't one."""
+        try:
+            return self.queues[pc_class].get_nowait()
+        except (KeyError, queue.Empty):
+            return None
+        finally:
+            # Either way, the prefetcher has some topping up to do.
+            self.wanted.set()
+
+    def put(self, details):
+        """
+        Keep a fetched character for later. Returns False if its class's queue is
+        already full (or it's a class we don't keep).
+        """
+        pc_class = details.get("class")
+        # A Queue with a maxsize of zero is unbounded, so empty depths need checking.
+        if not self.depths.get(pc_class):
+            return False
+        try:
+            self.queues[pc_class].put_nowait(details)
+        except queue.Full:
+            return False
+        return True
+
+    def needs_more(self):
+        return any(q.qsize() < self.depths[c] for c, q in self.queues.items())
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wanted.wait()
+            self.wanted.clear()
+            while self.needs_more() and not self.stopped.is_set():
+                try:
+                    self.put(self.fetch())
+                except upstream.UpstreamUnavailable:
+                    # Don't spin while the upstream is down.
+                    if self.stopped.wait(RETRY_DELAY):
+                        return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(fetch, default_depth=DEFAULT_DEPTH):
+    """
+    Return the process-wide pool, creating and starting it the first time. It's
+    started lazily so that each (forked) worker process gets its own thread.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CharacterPool(fetch, default_depth=default_depth)
+            _pool.start()
+        return _pool
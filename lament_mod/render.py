@@ -0,0 +1,354 @@
+#!/usr/bin/python
+
+import io
+import threading
+import zlib
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    StreamObject,
+)
+
+# Writes filled sheets without copying the templates around for every one of them.
+#
+# Each template page's artwork (its content and everything that content needs - fonts,
+# images, and so on) is turned into a Form XObject and serialized ONCE, when the
+# template is loaded, with object numbers that are reserved for it in every document we
+# write. A filled sheet is then just a tiny page that draws its template page's
+# XObject, with the field values stamped on top. Writing a document means copying the
+# pre-serialized artwork bytes for the templates it uses (once, no matter how many
+# sheets use them) and serializing a handful of small dictionaries and text streams.
+
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+# The names the background XObject and the text font go by in each page's resources.
+BACKGROUND_NAME = "/LamentBG"
+FONT_NAME = "/LamentTiRo"
+
+# The font the values are drawn in. The templates' fields all use Times-Roman, which
+# every PDF viewer has built in, so it doesn't need embedding.
+FONT = (
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman "
+    b"/Encoding /WinAnsiEncoding >>"
+)
+
+
+def serialize(pdf_object):
+    """Return the PDF syntax for a PyPDF2 object."""
+    stream = io.BytesIO()
+    pdf_object.writeToStream(stream, None)
+    return stream.getvalue()
+
+
+def object_body(number, body):
+    return b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+
+def format_array(numbers):
+    return b"[" + b" ".join(b"%g" % float(n) for n in numbers) + b"]"
+
+
+def copy_object(pdf_object, number_for):
+    """
+    Copy a PyPDF2 object, pointing every reference it makes (however deeply nested)
+    at object number number_for(reference) instead.
+    """
+    if isinstance(pdf_object, IndirectObject):
+        return IndirectObject(number_for(pdf_object), 0, None)
+    if isinstance(pdf_object, StreamObject):
+        copy = StreamObject()
+        copy._data = pdf_object._data
+    elif isinstance(pdf_object, DictionaryObject):
+        copy = DictionaryObject()
+    elif isinstance(pdf_object, ArrayObject):
+        return ArrayObject(copy_object(value, number_for) for value in pdf_object)
+    else:
+        return pdf_object
+
+    for key, value in pdf_object.items():
+        # Stream lengths are worked out again when the stream is written.
+        if not (key == "/Length" and isinstance(pdf_object, StreamObject)):
+            copy[NameObject(key)] = copy_object(value, number_for)
+    return copy
+
+
+class ObjectNumbers(object):
+    """
+    Hands out the object numbers reserved for template artwork. Every document
+    reserves all of them, whether it uses them or not, so the artwork can be
+    serialized once with its numbers baked in.
+    """
+
+    def __init__(self):
+        self.count = 0
+        # The highest number a document has used for its own objects. Reservations
+        # start after it, so artwork reserved while a document is being written can't
+        # take numbers that document has already used.
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, how_many):
+        """Reserve how_many object numbers, and return the first of them."""
+        with self.lock:
+            first = max(self.count, self.used) + 1
+            self.count = first + how_many - 1
+            return first
+
+    def use(self, at_least, how_many):
+        """
+        Return the first of how_many numbers for a document's own objects, no lower
+        than at_least and after all of the reserved numbers.
+        """
+        with self.lock:
+            first = max(at_least, self.count + 1)
+            self.used = max(self.used, first + how_many - 1)
+            return first
+
+
+reserved = ObjectNumbers()
+FONT_NUMBER = reserved.reserve(1)
+# Every page refers to the page tree, so its number (and the catalog's) has to be
+# known before the first page is written.
+PAGES_NUMBER = reserved.reserve(1)
+CATALOG_NUMBER = reserved.reserve(1)
+
+
+class BackgroundPage(object):
+    """A template page's artwork, as a pre-serialized Form XObject."""
+
+    def __init__(self, number, media_box, crop_box, rotate):
+        self.number = number
+        self.media_box = media_box
+        self.crop_box = crop_box
+        self.rotate = rotate
+
+
+class Background(object):
+    """
+    The artwork of every page of a template, serialized once.
+
+    :param pages: The template's pages (PyPDF2 PageObjects).
+    """
+
+    def __init__(self, pages):
+        xobjects = [self._xobject(page) for page in pages]
+
+        # Find everything the artwork refers to, so we know how many object numbers
+        # to reserve, then serialize it all with references to the reserved numbers.
+        self._numbers = {}
+        self._objects = []
+        for xobject in xobjects:
+            self._add(xobject, key=id(xobject))
+        first = reserved.reserve(len(self._objects))
+
+        self.objects = {}
+        for index, (key, pdf_object) in enumerate(self._objects):
+            self.objects[first + index] = object_body(
+                first + index, serialize(self._renumber(pdf_object, first))
+            )
+
+        self.pages = []
+        for page, xobject in zip(pages, xobjects):
+            crop_box = page.get("/CropBox")
+            self.pages.append(
+                BackgroundPage(
+                    first + self._numbers[id(xobject)],
+                    [float(n) for n in page["/MediaBox"]],
+                    [float(n) for n in crop_box] if crop_box is not None else None,
+                    int(page.get("/Rotate", 0)),
+                )
+            )
+        del self._numbers, self._objects
+
+    @property
+    def size(self):
+        """The number of bytes the artwork takes up in a document."""
+        return sum(len(body) for body in self.objects.values())
+
+    @staticmethod
+    def _xobject(page):
+        """Turn a page's content into a Form XObject."""
+        contents = page["/Contents"].getObject()
+        if not isinstance(contents, ArrayObject):
+            contents = [contents]
+        data = b"\n".join(stream.getObject().getData() for stream in contents)
+
+        xobject = StreamObject()
+        xobject._data = zlib.compress(data)
+        xobject[NameObject("/Type")] = NameObject("/XObject")
+        xobject[NameObject("/Subtype")] = NameObject("/Form")
+        xobject[NameObject("/Filter")] = NameObject("/FlateDecode")
+        xobject[NameObject("/BBox")] = page["/MediaBox"]
+        xobject[NameObject("/Resources")] = page["/Resources"]
+        if "/Group" in page:
+            xobject[NameObject("/Group")] = page["/Group"]
+        return xobject
+
+    def _add(self, pdf_object, key):
+        """Number an object (relative to the start of our range) and everything it uses."""
+        if key in self._numbers:
+            return
+        self._numbers[key] = len(self._objects)
+        self._objects.append((key, pdf_object))
+        # Copying visits every reference the object makes, which numbers them too.
+        copy_object(pdf_object, self._add_reference)
+
+    def _add_reference(self, reference):
+        """
+        Number the object a reference points to. The copy this is called for is thrown
+        away, so the number it gets doesn't matter.
+        """
+        self._add(reference.getObject(), (reference.idnum, reference.generation))
+        return 0
+
+    def _renumber(self, pdf_object, first):
+        """Copy an object, pointing every reference it makes at our reserved numbers."""
+
+        def number_for(reference):
+            return first + self._numbers[(reference.idnum, reference.generation)]
+
+        return copy_object(pdf_object, number_for)
+
+
+class Document(object):
+    """
+    A PDF made of filled sheets, built up one page at a time and written all at once.
+    Template artwork used by any number of pages is only written once.
+    """
+
+    def __init__(self):
+        self.pages = []
+
+    def add_page(self, background, page_number, content):
+        """
+        Add a page that draws the given page of a Background, with content (PDF
+        content stream operators) on top.
+        """
+        self.pages.append((background, page_number, content))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def write(self, output):
+        """Write the document to output, a binary file-like object."""
+        for chunk in stream(self.pages):
+            output.write(chunk)
+
+    def to_bytes(self):
+        output = io.BytesIO()
+        self.write(output)
+        return output.getvalue()
+
+
+def stream(pages):
+    """
+    Write a document a page at a time, yielding its bytes as they're ready. pages is
+    an iterable of (background, page_number, content) tuples, like the arguments to
+    Document.add_page(), and it's only consumed as far as the output has got - so the
+    start of a document can be sent before its last pages have been filled.
+
+    Each page's artwork is written just before the first page that uses it. The page
+    tree and the cross-reference table, which need every page, come last.
+
+    Templates can be loaded (reserving more numbers for their artwork) while the
+    document is being written, so each page is numbered after the reserved numbers as
+    they are when it's written, not when the document was started.
+    """
+    pages_number = PAGES_NUMBER
+    catalog_number = CATALOG_NUMBER
+
+    offsets = {}
+    position = 0
+    page_numbers = []
+    written = set()
+    next_number = 0
+
+    def emit_object(number, body):
+        nonlocal position
+        offsets[number] = position
+        position += len(body)
+        return body
+
+    position = len(PDF_HEADER)
+    yield PDF_HEADER + emit_object(FONT_NUMBER, object_body(FONT_NUMBER, FONT))
+
+    for background, index, content in pages:
+        chunk = []
+        if id(background) not in written:
+            written.add(id(background))
+            for number, body in background.objects.items():
+                chunk.append(emit_object(number, body))
+
+        page = background.pages[index]
+        # Each page takes two numbers (the page and its content), after every number
+        # that's been reserved so far.
+        page_number = reserved.use(next_number, 2)
+        content_number = page_number + 1
+        next_number = content_number + 1
+        page_numbers.append(page_number)
+
+        page_body = [
+            b"<< /Type /Page /Parent %d 0 R" % pages_number,
+            b"/MediaBox " + format_array(page.media_box),
+        ]
+        if page.crop_box is not None:
+            page_body.append(b"/CropBox " + format_array(page.crop_box))
+        if page.rotate:
+            page_body.append(b"/Rotate %d" % page.rotate)
+        page_body.append(
+            b"/Resources << /XObject << %s %d 0 R >> /Font << %s %d 0 R >> >>"
+            % (BACKGROUND_NAME.encode(), page.number, FONT_NAME.encode(), FONT_NUMBER)
+        )
+        page_body.append(b"/Contents %d 0 R >>" % content_number)
+        chunk.append(
+            emit_object(page_number, object_body(page_number, b"\n".join(page_body)))
+        )
+
+        data = zlib.compress(b"q %s Do Q\n" % BACKGROUND_NAME.encode() + content)
+        chunk.append(
+            emit_object(
+                content_number,
+                object_body(
+                    content_number,
+                    b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream"
+                    % (len(data), data),
+                ),
+            )
+        )
+        yield b"".join(chunk)
+
+    size = max(offsets) + 1
+    kids = b" ".join(b"%d 0 R" % number for number in page_numbers)
+    chunk = [
+        emit_object(
+            pages_number,
+            object_body(
+                pages_number,
+                b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_numbers)),
+            ),
+        ),
+        emit_object(
+            catalog_number,
+            object_body(
+                catalog_number, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_number
+            ),
+        ),
+    ]
+
+    # Numbers reserved for templates this document doesn't use are free.
+    free = [n for n in range(1, size) if n not in offsets]
+    next_free = dict(zip([0] + free, free + [0]))
+    chunk.append(b"xref\n0 %d\n" % size)
+    for number in range(size):
+        if number in offsets:
+            chunk.append(b"%010d 00000 n \n" % offsets[number])
+        else:
+            generation = 65535 if number == 0 else 0
+            chunk.append(b"%010d %05d f \n" % (next_free[number], generation))
+    chunk.append(
+        b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (size, catalog_number, position)
+    )
+    yield b"".join(chunk)
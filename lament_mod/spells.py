@@ -2,9 +2,8 @@
 
 import math
 import os
-import subprocess
-import tempfile
-from fdfgen import forge_fdf
+import lament_mod.cache as cache
+import lament_mod.filler as filler
 import lament_mod.tools as tools
 
 CLERIC_SPELLS = [
@@ -163,8 +162,35 @@ def get_magic_notes(pcClass, level, highest_spell_level):
     return notes
 
 
-def create_spellsheet_pdf(details, PC_name, filename=None, directory=None):
-    """Get spell list for character, fill spell sheet PDF with spell information."""
+def create_spellsheet_pdf(details):
+    """
+    Get spell list for character, fill spell sheet PDF with spell information. Returns
+    the filled sheet - a filler.FilledSheet, or the PDF's bytes if pdftk filled it.
+
+    A spell sheet only depends on the class, level and spells, so lots of characters
+    share one. Filled sheets are cached (see cache.py), keyed by their fields.
+    """
+    fields = get_spellsheet_fields(details)
+    key = spellsheet_key(fields)
+
+    if tools.PDF_FILLER == "pdftk":
+        return cache.get_cache().get(
+            key, lambda: tools.fill_with_pdftk(FILLABLE_SPELL_SHEET, fields)
+        )
+
+    data = cache.get_cache().get(
+        key, lambda: filler.fill_sheet(FILLABLE_SPELL_SHEET, fields).dumps()
+    )
+    return filler.FilledSheet.loads(FILLABLE_SPELL_SHEET, data)
+
+
+def spellsheet_key(fields):
+    """The cache key for a spell sheet filled with fields (see cache.sheet_key())."""
+    return cache.sheet_key(FILLABLE_SPELL_SHEET, fields, tools.PDF_FILLER)
+
+
+def get_spellsheet_fields(details):
+    """Return the spell sheet's form fields for a character, as a dictionary."""
     spell_list = create_spell_list(details["spell"], details["class"], details["level"])
     spell_details = tools.get_item_details(spell_list, "Spell", filename=None)
     spell_slots = get_spell_slots(details["class"], details["level"])
@@ -188,27 +214,4 @@ def create_spellsheet_pdf(details, PC_name, filename=None, directory=None):
     spell_slots = tools.add_PDF_field_names(spell_slots, details["class"])
     spell_list = {**spell_list, **spell_slots}
 
-    if directory is None:
-        directory = tempfile.TemporaryDirectory(dir=os.getcwd()).name
-
-    spell_name = PC_name + "_Spells.pdf"
-    spell_fdf_name = PC_name + "_Spells.fdf"
-
-    fdf_spell_data = forge_fdf("", spell_list, [], [], [])
-    with open(os.path.join(directory, spell_fdf_name), "wb") as f:
-        f.write(fdf_spell_data)
-
-    path_to_pdftk = tools.get_pdftk_path()
-
-    args = [
-        path_to_pdftk,
-        FILLABLE_SPELL_SHEET,
-        "fill_form",
-        spell_fdf_name,
-        "output",
-        spell_name,
-        "flatten",
-    ]
-
-    # Fill the spell form with PDFtk, store them in the tempfiles directory.
-    subprocess.run(args, cwd=directory, **tools.subprocess_args(False))
+    return spell_list
@@ -1,10 +1,16 @@
 #!/usr/bin/python
 
 import csv
+import functools
 import subprocess
-import requests
 import os
 import platform
+import time
+from fdfgen import forge_fdf
+import lament_mod.corpus as corpus
+import lament_mod.generator as generator
+import lament_mod.prefetch as prefetch
+import lament_mod.upstream as upstream
 
 LEVEL_ONE_SPELLS = os.path.join(
     os.path.dirname(__file__), "Item Lists", "LevelOneSpells.csv"
@@ -22,6 +28,36 @@ WEAPON_FIELDS = ["Weapon", "Damage", "Short", "Medium", "Long", "Ammo"]
 
 CHARACTER_GEN_URL = "http://character.totalpartykill.ca/lotfp/json"
 
+# Where characters come from: "local" rolls them in-process (see generator.py),
+# "remote" fetches them from CHARACTER_GEN_URL like the good old days, and "replay"
+# picks them out of the recorded corpus (see corpus.py).
+CHARACTER_SOURCE = os.environ.get("LAMENT_CHARACTER_SOURCE", "local")
+
+# What to do with the corpus when characters come from the remote generator, as a
+# comma-separated list. "record" saves every fetched character in the corpus, and
+# "fallback" replays a recorded character when the remote generator is unavailable.
+CORPUS_MODES = {
+    mode for mode in os.environ.get("LAMENT_CORPUS_MODES", "").split(",") if mode
+}
+
+# How to fill the PDF forms: "builtin" fills them in-process (see filler.py), and
+# "pdftk" runs the pdftk binary once per sheet (through pipes - no files involved).
+PDF_FILLER = os.environ.get("LAMENT_PDF_FILLER", "builtin")
+
+# How to merge the sheets pdftk fills: "compact" stores each font, image and so on
+# only once, in compressed object streams (see merge.py), and "pypdf2" appends whole
+# sheets with PyPDF2's PdfFileMerger. Sheets filled in-process share their templates'
+# artwork anyway, so this doesn't apply to them.
+PDF_MERGER = os.environ.get("LAMENT_PDF_MERGER", "compact")
+
+# How many random characters to fetch while looking for one of a specific class. With
+# seven classes, missing this many times in a row is vanishingly unlikely.
+MAX_CLASS_ATTEMPTS = 50
+
+# How many remote characters of each class to prefetch in the background (see
+# prefetch.py). Zero turns prefetching off.
+PREFETCH_DEPTH = int(os.environ.get("LAMENT_PREFETCH_DEPTH", prefetch.DEFAULT_DEPTH))
+
 
 def add_PDF_field_names(equiplist, type="NonEnc"):
     """Takes a list of items and their type and returns a dictionary with the items
@@ -47,6 +83,27 @@ def get_pdftk_path():
     return path_to_pdftk
 
 
+def pdftk_fill_args(template_path):
+    """
+    The command-line arguments for pdftk to fill (and flatten) the template at
+    template_path, reading the FDF data from stdin and writing the PDF to stdout.
+    """
+    return [get_pdftk_path(), template_path, "fill_form", "-", "output", "-", "flatten"]
+
+
+def fill_with_pdftk(template_path, values):
+    """
+    Fill the template at template_path with values (a dictionary of field names to
+    values) using pdftk, and return the filled PDF as bytes.
+    """
+    args = pdftk_fill_args(template_path)
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, **subprocess_args(False))
+    filled, errors = process.communicate(forge_fdf("", values, [], [], []))
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, filled, errors)
+    return filled
+
+
 def subprocess_args(include_stdout=True):
     """
     Create a set of arguments which make a ``subprocess.Popen`` (and
@@ -104,28 +161,64 @@ def subprocess_args(include_stdout=True):
 
 
 def fetch_character(pc_class=None):
-    """Fetch character data JSON from the remote generator."""
-    with requests.session() as r:
-        details = {"class": ""}
-        if pc_class:
-            while details["class"] != pc_class:
-                try:
-                    r = requests.get(CHARACTER_GEN_URL, timeout=10)
-                    details = r.json()
-                except ConnectionError as e:
-                    print("There was a connection error: %s" % e)
-                except TimeoutError as e:
-                    print("The connection timed out: %s" % e)
-        else:
-            try:
-                r = requests.get(CHARACTER_GEN_URL, timeout=10)
-                details = r.json()
-            except ConnectionError as e:
-                print("There was a connection error: %s" % e)
-            except TimeoutError as e:
-                print("The connection timed out: %s" % e)
-
-        return details
+    """
+    Fetch character data JSON from the remote generator, generate it locally, or
+    replay it from the corpus, depending on CHARACTER_SOURCE.
+
+    :raises upstream.UpstreamUnavailable: if the remote generator can't be reached or
+    never comes up with the right class (and there's no corpus to fall back on).
+    """
+    if CHARACTER_SOURCE == "local":
+        return generator.generate_character(pc_class)
+    if CHARACTER_SOURCE == "replay":
+        return corpus.get_corpus().choice(pc_class)
+
+    try:
+        return fetch_remote_character(pc_class)
+    except upstream.UpstreamUnavailable:
+        if "fallback" not in CORPUS_MODES:
+            raise
+        return corpus.get_corpus().choice(pc_class)
+
+
+def fetch_remote_character(pc_class=None):
+    """
+    Fetch character data JSON from the remote generator.
+
+    The remote generator doesn't take a class, so for a specific class we keep asking
+    for random characters until we get one - but only MAX_CLASS_ATTEMPTS times, and
+    only until the deadline runs out. If prefetching is on, a class is served from
+    the prefetch pool when it can be, and the wrong classes we fetch along the way
+    are saved in the pool for later.
+    """
+    fetch = functools.partial(get_remote_json, upstream.get_client(CHARACTER_GEN_URL))
+    pool = None
+    if pc_class and PREFETCH_DEPTH > 0:
+        pool = prefetch.get_pool(fetch, PREFETCH_DEPTH)
+        details = pool.take(pc_class)
+        if details is not None:
+            return details
+
+    deadline = time.monotonic() + upstream.FETCH_DEADLINE
+
+    for attempt in range(MAX_CLASS_ATTEMPTS):
+        details = fetch(deadline)
+        if not pc_class or details.get("class") == pc_class:
+            return details
+        if pool is not None:
+            pool.put(details)
+
+    raise upstream.UpstreamUnavailable(
+        "The character generator never came up with a {}.".format(pc_class)
+    )
+
+
+def get_remote_json(client, deadline=None):
+    """Fetch one random character, recording it in the corpus if CORPUS_MODES says so."""
+    details = client.get_json(deadline)
+    if "record" in CORPUS_MODES:
+        corpus.get_corpus().record(details)
+    return details
 
 
 def format_equipment_list(details, calculate_encumbrance=True):
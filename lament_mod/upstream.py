@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# A process-wide HTTP client for the remote character generator. Every fetch shares one
+# keep-alive connection pool, failed requests are retried a few times with jittered
+# backoff, and a circuit breaker stops us from hammering (and waiting on) an upstream
+# that's already down.
+
+# How many per-host connection pools to keep. Only one host is involved, so one is
+# all we need.
+POOL_CONNECTIONS = 1
+# How many connections to keep open to the upstream, which is really just the maximum
+# number of simultaneous requests per process.
+POOL_MAXSIZE = 10
+
+# (connect, read) timeouts for a single request, in seconds.
+REQUEST_TIMEOUT = (3.05, 10)
+# The most time a single fetch is allowed to take, retries and all, in seconds.
+FETCH_DEADLINE = 20
+
+# How many times to try a request before giving up, and the backoff between tries.
+# The actual wait is a random amount up to BACKOFF_BASE * 2 ** attempt, capped at
+# BACKOFF_MAX ("full jitter"), so a herd of workers doesn't retry in lockstep.
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2
+
+# The breaker opens after this many failures in a row, and stays open (failing every
+# request immediately) for BREAKER_RESET_TIMEOUT seconds before letting one through to
+# see if the upstream is back.
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+
+class UpstreamUnavailable(Exception):
+    """The remote generator couldn't be reached (or the breaker is open)."""
+
+
+class CircuitBreaker(object):
+    """
+    A thread-safe circuit breaker. Closed lets everything through, open fails
+    everything fast, and half-open lets a single trial request through once the reset
+    timeout has passed. Success closes the breaker; failure opens it again.
+    """
+
+    def __init__(
+        self,
+        threshold=BREAKER_THRESHOLD,
+        reset_timeout=BREAKER_RESET_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+    def allow(self):
+        """Return whether a request is allowed through right now."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open - this caller gets to find out if the upstream is back.
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+class UpstreamClient(object):
+    """A pooled, keep-alive JSON client for a single upstream URL."""
+
+    def __init__(
+        self,
+        url,
+        max_attempts=MAX_ATTEMPTS,
+        timeout=REQUEST_TIMEOUT,
+        breaker=None,
+        sleep=time.sleep,
+    ):
+        self.url = url
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        # We do our own retrying (with backoff and the breaker), so the adapter doesn't.
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_json(self, deadline=None):
+        """
+        GET the upstream URL and return the decoded JSON, retrying failures until
+        max_attempts or the deadline (a time.monotonic() value) runs out.
+
+        :raises UpstreamUnavailable: if the breaker is open or every attempt failed.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + FETCH_DEADLINE
+
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                raise UpstreamUnavailable("The character generator is unavailable.")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                response = self.session.get(self.url, timeout=self._timeout(remaining))
+                response.raise_for_status()
+                details = response.json()
+            except (requests.RequestException, ValueError) as e:
+                self.breaker.record_failure()
+                last_error = e
+            else:
+                self.breaker.record_success()
+                return details
+
+            # Back off before trying again, unless that would blow the deadline.
+            if attempt + 1 < self.max_attempts:
+                backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+                if time.monotonic() + backoff >= deadline:
+                    break
+                self.sleep(backoff)
+        else:
+            raise UpstreamUnavailable(
+                "The character generator failed: {}".format(last_error)
+            )
+
+        raise UpstreamUnavailable("The character generator took too long.")
+
+    def _timeout(self, remaining):
+        """Shrink the (connect, read) timeouts so a request can't outlast the deadline."""
+        connect, read = self.timeout
+        return (min(connect, remaining), min(read, remaining))
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url):
+    """Return the process-wide client for url, creating it the first time."""
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = UpstreamClient(url)
+        return _clients[url]
@@ -1,4 +1,5 @@
 import pytest
+import os
 import json
 import ethan_portfolio
 import lament_mod.character as character
@@ -49,3 +50,70 @@ def halfling(mocker):
     with open("tests/mocked_fetch_character.json", "r") as f:
         mock_fetch.return_value = json.load(f)
     return character.LotFPCharacter()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "codec benchmarks")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Run the codec benchmarks (skipped by default).",
+    )
+    group.addoption(
+        "--benchmark-large",
+        action="store_true",
+        help="Include the 100 MB inputs in the codec benchmarks.",
+    )
+    group.addoption(
+        "--benchmark-save",
+        action="store_true",
+        help="Save the measured throughputs as the new baselines.",
+    )
+    group.addoption(
+        "--benchmark-baselines",
+        default=os.path.join(os.path.dirname(__file__), "benchmark_baselines.json"),
+        help="The JSON file of baseline throughputs to compare against.",
+    )
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=25.0,
+        help="Fail a benchmark if its throughput is more than this percentage below "
+        "its baseline (default: 25).",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: a codec throughput benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the benchmarks unless they're asked for."""
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def benchmark_baselines(request):
+    """
+    Load the baseline throughputs, and save the measured ones over them at the end
+    of the session if --benchmark-save was given.
+    """
+    path = request.config.getoption("--benchmark-baselines")
+    try:
+        with open(path, "r") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    measured = {}
+    yield baselines, measured
+
+    if request.config.getoption("--benchmark-save") and measured:
+        with open(path, "w") as f:
+            json.dump({**baselines, **measured}, f, indent=2, sort_keys=True)
+            f.write("\n")
@@ -1,4 +1,6 @@
+import json
 import artlogic.artlogic as artlogic
+import artlogic.cache as cache
 import pytest
 
 
@@ -50,3 +52,182 @@ def test_handleData_too_long_integer():
         artlogic.handleData(str(over_32_bits))
         == "16746029 16723216 16712751 16753920 16714532 16715075 1118208"
     )
+
+
+def test_api_json_array(client):
+    """
+    Does the API handle a JSON array of inputs, in order, the same way as
+    handleData()?
+    """
+    inputs = ["FRED", "267487694 125043731", "", 42]
+    response = client.post("/artlogic/api", json=inputs)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    results = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert results == [
+        {"output": "251792692"},
+        {"output": "tacocat"},
+        {"output": ""},
+        {"error": "Expected a JSON string."},
+    ]
+
+
+def test_api_ndjson(client):
+    """
+    Does the API handle an NDJSON body a line at a time, skipping blank lines and
+    reporting lines that aren't JSON?
+    """
+    body = '"foot"\n\n"BIRD"\nnot json\n"251930706"\n'
+    response = client.post(
+        "/artlogic/api", data=body, content_type="application/x-ndjson"
+    )
+    assert response.status_code == 200
+
+    results = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert results == [
+        {"output": "267939702"},
+        {"output": "251930706"},
+        {"error": "Expected a JSON string."},
+        {"output": "BIRD"},
+    ]
+
+
+def test_api_bad_string_does_not_end_batch(client):
+    """
+    Does an input that can't be encoded (like a lone surrogate) get an error of its
+    own, without cutting off the results after it?
+    """
+    body = '["FRED", "\\ud800", "BIRD"]'
+    response = client.post("/artlogic/api", data=body, content_type="application/json")
+    assert response.status_code == 200
+
+    results = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert results[0] == {"output": "251792692"}
+    assert "error" in results[1]
+    assert results[2] == {"output": "251930706"}
+
+
+def test_api_rejects_non_array(client):
+    """
+    Does the API refuse JSON bodies that aren't arrays?
+    """
+    response = client.post("/artlogic/api", json={"input": "FRED"})
+    assert response.status_code == 400
+
+
+def test_convert_is_cacheable(client):
+    """
+    Does the GET form of the conversion return the output with a strong ETag and
+    caching headers, and answer a matching If-None-Match with 304 Not Modified?
+    """
+    response = client.get("/artlogic/convert", query_string={"input": "FRED"})
+    assert response.status_code == 200
+    assert response.data == b"251792692"
+    assert response.cache_control.public
+    assert response.cache_control.max_age == artlogic.RESULT_MAX_AGE
+
+    etag, is_weak = response.get_etag()
+    assert etag and not is_weak
+
+    response = client.get(
+        "/artlogic/convert",
+        query_string={"input": "FRED"},
+        headers={"If-None-Match": '"{}"'.format(etag)},
+    )
+    assert response.status_code == 304
+
+    response = client.get("/artlogic/result/" + cache.ResultCache.key_for("FRED"))
+    assert response.data == b"251792692"
+
+
+def test_convert_etag_follows_output(client, mocker):
+    """
+    Does the ETag change when the output for an input does (after the encoding rules
+    change, say), so that revalidating doesn't keep the old output?
+    """
+    etag, _ = client.get("/artlogic/convert", query_string={"input": "FRED"}).get_etag()
+
+    mocker.patch.object(artlogic, "results", cache.ResultCache(10))
+    mocker.patch.object(artlogic, "handleData", return_value="something else")
+    response = client.get(
+        "/artlogic/convert",
+        query_string={"input": "FRED"},
+        headers={"If-None-Match": '"{}"'.format(etag)},
+    )
+    assert response.status_code == 200
+    assert response.data == b"something else"
+    assert response.get_etag()[0] != etag
+
+
+def test_form_shows_output(app):
+    """
+    Does submitting the form show the output on the page it returns, rather than
+    redirecting to a result that another worker might not have?
+    """
+    app.config["WTF_CSRF_ENABLED"] = False
+    long_input = "go hang a salami, I'm a lasagna hog " * 50
+
+    response = app.test_client().post("/artlogic", data={"input_data": long_input})
+    assert response.status_code == 200
+    assert artlogic.handleData(long_input).encode() in response.data
+
+
+def test_result_cache_evicts_least_recently_used():
+    """
+    Does the result cache stay within its size, evicting the least recently used
+    result, and only compute results it doesn't already have?
+    """
+    results = cache.ResultCache(2)
+    calls = []
+
+    def compute(data):
+        calls.append(data)
+        return data.upper()
+
+    first, _ = results.get_or_compute("first", compute)
+    results.get_or_compute("second", compute)
+    assert results.get(first) == "FIRST"
+    results.get_or_compute("third", compute)
+    results.get_or_compute("first", compute)
+
+    assert len(results) == 2
+    assert results.get(results.key_for("second")) is None
+    assert calls == ["first", "second", "third"]
+
+
+def test_result_cache_is_bounded_by_bytes():
+    """
+    Does the result cache evict results to stay within its byte limit, and refuse to
+    keep results that are too big?
+    """
+    results = cache.ResultCache(100, max_bytes=10, max_result_bytes=6)
+    assert results.put("a", "aaaa")
+    assert results.put("b", "bbbb")
+    assert results.put("c", "cccc")
+    assert "a" not in results
+    assert results.size_in_bytes == 8
+
+    assert not results.put("d", "d" * 7)
+    assert "d" not in results and "b" in results
+
+
+@pytest.mark.parametrize(
+    "example, expected",
+    [
+        ("267487694  125043731", "tacocat"),
+        ("\t267487694\n125043731 \r\n", "tacocat"),
+        ("+251792692", "FRED"),
+        (
+            "267487694 125043731 and more",
+            "16715380 16750186 16580996 16713097 16187703 133178913 267664235",
+        ),
+        ("1-2", "7676483"),
+    ],
+)
+def test_handleData_whitespace_and_mixed(example, expected):
+    """
+    Does handleData() read integers separated by any whitespace, and treat input
+    that's only partly integers as a string?
+    """
+    assert artlogic.handleData(example) == expected
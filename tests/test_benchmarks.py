@@ -0,0 +1,116 @@
+import pytest
+import functools
+import random
+import string
+import timeit
+import artlogic.artlogic as artlogic
+import artlogic.encode as encode
+
+# Run with:
+#   pytest tests/test_benchmarks.py --benchmark [--benchmark-large]
+# and add --benchmark-save to record the results as the new baselines (in
+# tests/benchmark_baselines.json by default). Benchmarks without a baseline always
+# pass; the rest fail if their throughput drops more than --benchmark-tolerance
+# percent below it. Baselines only mean anything on the machine that recorded them.
+
+SIZES = {"chunk": 4, "1KB": 1 << 10, "1MB": 1 << 20, "100MB": 100 << 20}
+# These sizes only run with --benchmark-large.
+LARGE_SIZES = ["100MB"]
+
+ASCII_CHARS = string.ascii_letters + string.digits + string.punctuation + " "
+# Mixed-byte data adds characters that are 2, 3, and 4 bytes long in UTF-8.
+MIXED_CHARS = ASCII_CHARS + "éüñßØ" + "☕€日本語" + "🐍🚀"
+
+# Large inputs are built by repeating a random pattern of this many bytes.
+PATTERN_SIZE = 1 << 16
+
+# Each benchmark is timed over this many rounds, each of which calls the function
+# enough times to take at least 0.2 seconds. The fastest round counts.
+ROUNDS = 5
+
+# Each target is a function to benchmark, and a function to build its argument from
+# the input text.
+TARGETS = {
+    "encode": (encode.encode, lambda text: text),
+    "decode": (encode.decode, encode.encode),
+    "handleData-encode": (artlogic.handleData, lambda text: text),
+    "handleData-decode": (artlogic.handleData, artlogic.handleData),
+    "encode_bytes": (encode.encode_bytes, str.encode),
+    "decode_bytes": (encode.decode_bytes, encode.encode),
+    "encode_many": (encode.encode_many, str.encode),
+    "decode_many": (encode.decode_many, lambda text: encode.encode_many(text.encode())),
+    "encode_parallel": (encode.encode_parallel, str.encode),
+    "decode_parallel": (
+        encode.decode_parallel,
+        lambda text: encode.encode_many(text.encode()),
+    ),
+}
+
+
+@functools.lru_cache(maxsize=2)
+def make_text(kind, size):
+    """
+    Build a random string of the given kind ("ascii" or "mixed") that is exactly
+    size bytes long in UTF-8. The same arguments always give the same string.
+    """
+    chars = ASCII_CHARS if kind == "ascii" else MIXED_CHARS
+    rng = random.Random(42)
+
+    # Start with a letter, so handleData() never mistakes the text for integers.
+    pieces = ["x"]
+    length = 1
+    pattern_size = min(size, PATTERN_SIZE)
+    while length < pattern_size:
+        char = rng.choice(chars)
+        char_length = len(char.encode())
+        if length + char_length > pattern_size:
+            # Fill whatever space is left with single-byte characters.
+            char, char_length = "y", 1
+        pieces.append(char)
+        length += char_length
+    pattern = "".join(pieces)
+
+    text = pattern * (size // pattern_size)
+    if size % pattern_size:
+        text += make_text(kind, size % pattern_size)
+    return text
+
+
+def measure(function, argument):
+    """
+    Time function(argument) over ROUNDS rounds. Returns the fastest time for a
+    single call, in seconds.
+    """
+    timer = timeit.Timer(lambda: function(argument))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=ROUNDS, number=number)) / number
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("size", list(SIZES))
+@pytest.mark.parametrize("kind", ["ascii", "mixed"])
+@pytest.mark.parametrize("target", list(TARGETS))
+def test_throughput(request, benchmark_baselines, target, kind, size):
+    """
+    Is the target's throughput (in bytes of original text per second) within the
+    tolerance of its baseline?
+    """
+    if size in LARGE_SIZES and not request.config.getoption("--benchmark-large"):
+        pytest.skip("The {} inputs only run with --benchmark-large".format(size))
+
+    baselines, measured = benchmark_baselines
+    function, prepare = TARGETS[target]
+    text = make_text(kind, SIZES[size])
+    assert len(text.encode()) == SIZES[size]
+
+    throughput = SIZES[size] / measure(function, prepare(text))
+    key = "/".join((target, kind, size))
+    measured[key] = throughput
+
+    baseline = baselines.get(key)
+    if baseline and not request.config.getoption("--benchmark-save"):
+        tolerance = request.config.getoption("--benchmark-tolerance")
+        assert throughput >= baseline * (1 - tolerance / 100), (
+            "{} throughput dropped from {:.0f} to {:.0f} bytes/s, more than the "
+            "{}% tolerance".format(key, baseline, throughput, tolerance)
+        )
@@ -0,0 +1,102 @@
+import pytest
+import os
+import threading
+import time
+import lament_mod.cache as cache
+import lament_mod.filler as filler
+import lament_mod.spells as spells
+
+
+@pytest.fixture
+def cleric():
+    return {"class": "Cleric", "level": 1, "spell": []}
+
+
+def test_memory_is_lru():
+    """Are the least recently used sheets dropped once memory is full?"""
+    sheets = cache.SheetCache(memory_bytes=10, directory=None)
+    sheets.get("a", lambda: b"aaaa")
+    sheets.get("b", lambda: b"bbbb")
+    sheets.get("a", lambda: b"not again")
+    sheets.get("c", lambda: b"cccc")
+    assert list(sheets.memory) == ["a", "c"]
+    assert sheets.get("b", lambda: b"BBBB") == b"BBBB"
+
+
+def test_disk_is_shared(tmp_path):
+    """Does a sheet on disk get used by another cache (i.e. another process)?"""
+    cache.SheetCache(directory=str(tmp_path)).get("key", lambda: b"sheet")
+    other = cache.SheetCache(directory=str(tmp_path))
+    assert other.get("key", lambda: pytest.fail("Filled it again")) == b"sheet"
+
+
+def test_disk_is_lru(tmp_path):
+    """Are the least recently used sheets removed once the disk tier is full?"""
+    sheets = cache.SheetCache(memory_bytes=0, directory=str(tmp_path), disk_bytes=10)
+    sheets.get("a", lambda: b"aaaa")
+    sheets.get("b", lambda: b"bbbb")
+    # Make "b" the least recently used, with times far enough apart to tell.
+    os.utime(sheets._path("a"), (2000, 2000))
+    os.utime(sheets._path("b"), (1000, 1000))
+    sheets.get("c", lambda: b"cccc")
+    assert sorted(os.listdir(str(tmp_path))) == ["a.sheet", "c.sheet"]
+
+
+def test_concurrent_misses_fill_once():
+    """Do simultaneous requests for the same sheet only fill it once?"""
+    sheets = cache.SheetCache(directory=None)
+    fills = []
+
+    def fill():
+        fills.append(1)
+        time.sleep(0.05)
+        return b"sheet"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(sheets.get("key", fill)))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [b"sheet"] * 5
+    assert len(fills) == 1
+
+
+def test_failed_fills_are_not_cached():
+    sheets = cache.SheetCache(directory=None)
+    with pytest.raises(ZeroDivisionError):
+        sheets.get("key", lambda: 1 / 0)
+    assert sheets.get("key", lambda: b"sheet") == b"sheet"
+    assert sheets.flights == {}
+
+
+def test_key_is_canonical():
+    """Is the key the same however the fields are ordered, and different otherwise?"""
+    key = cache.sheet_key("a/Sheet.pdf", {"one": 1, "two": "2"})
+    assert cache.sheet_key("b/Sheet.pdf", {"two": "2", "one": 1}) == key
+    assert cache.sheet_key("a/Sheet.pdf", {"one": 1, "two": "3"}) != key
+    assert cache.sheet_key("a/Sheet.pdf", {"one": 1, "two": "2"}, "pdftk") != key
+
+
+def test_spell_sheets_are_cached(mocker, cleric):
+    """Do identical characters share one filled spell sheet?"""
+    mocker.patch.object(cache, "get_cache", return_value=cache.SheetCache(directory=None))
+    fill_sheet = mocker.spy(filler, "fill_sheet")
+
+    first = spells.create_spellsheet_pdf(cleric)
+    second = spells.create_spellsheet_pdf(dict(cleric))
+    assert fill_sheet.call_count == 1
+    assert second.contents == first.contents
+    assert second.template_path == spells.FILLABLE_SPELL_SHEET
+
+    spells.create_spellsheet_pdf(dict(cleric, level=5))
+    assert fill_sheet.call_count == 2
+
+
+def test_filled_sheet_round_trip():
+    sheet = filler.FilledSheet("Sheet.pdf", [b"one", b"", b"three\x00\n"])
+    copy = filler.FilledSheet.loads("Sheet.pdf", sheet.dumps())
+    assert copy.contents == sheet.contents
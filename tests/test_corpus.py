@@ -0,0 +1,94 @@
+import pytest
+import json
+import os
+import lament_mod.corpus as corpus
+import lament_mod.tools as tools
+import lament_mod.upstream as upstream
+
+
+@pytest.fixture
+def halfling():
+    with open("tests/mocked_fetch_character.json", "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def specialist():
+    with open("tests/mocked_fetch_specialist.json", "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def recorded(tmp_path, halfling, specialist, mocker):
+    """A corpus holding one Halfling and one Specialist, used by fetch_character."""
+    recorded = corpus.Corpus(str(tmp_path))
+    recorded.record(halfling)
+    recorded.record(specialist)
+    mocker.patch.object(corpus, "get_corpus", return_value=recorded)
+    return recorded
+
+
+def test_record_deduplicates(tmp_path, halfling):
+    """Is the same character only stored once, gzipped, under its class?"""
+    recorded = corpus.Corpus(str(tmp_path))
+    digest = recorded.record(halfling)
+    assert recorded.record(dict(halfling)) == digest
+    assert len(recorded) == 1
+    assert os.listdir(str(tmp_path / "Halfling")) == [digest + ".json.gz"]
+
+
+@pytest.mark.parametrize("pc_class", ["../../Escaped", "Bard", None])
+def test_record_refuses_unknown_classes(tmp_path, halfling, pc_class):
+    """Is a character whose class we don't know left out, rather than used as a path?"""
+    recorded = corpus.Corpus(str(tmp_path / "corpus"))
+    assert recorded.record(dict(halfling, **{"class": pc_class})) is None
+    assert len(recorded) == 0
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_index_is_read_from_disk(recorded, halfling):
+    """Does a new Corpus find the characters an old one recorded?"""
+    assert len(corpus.Corpus(recorded.directory)) == 2
+    assert corpus.Corpus(recorded.directory).choice("Halfling") == halfling
+
+
+def test_choice(recorded, halfling, specialist):
+    """Are random and class-filtered characters replayed, and fresh each time?"""
+    assert recorded.choice() in (halfling, specialist)
+    assert recorded.choice("Specialist") == specialist
+    assert recorded.choice("Halfling") is not recorded.choice("Halfling")
+    with pytest.raises(corpus.EmptyCorpus):
+        recorded.choice("Cleric")
+
+
+def test_replay_mode(recorded, specialist, mocker):
+    """Does the replay source serve characters without touching the network?"""
+    mocker.patch.object(tools, "CHARACTER_SOURCE", "replay")
+    mock_client = mocker.patch.object(upstream, "get_client")
+    assert tools.fetch_character("Specialist") == specialist
+    mock_client.assert_not_called()
+
+
+def test_record_mode(tmp_path, specialist, mocker):
+    """Are remote characters recorded as they're fetched?"""
+    recorded = corpus.Corpus(str(tmp_path))
+    mocker.patch.object(corpus, "get_corpus", return_value=recorded)
+    mocker.patch.object(tools, "CHARACTER_SOURCE", "remote")
+    mocker.patch.object(tools, "CORPUS_MODES", {"record"})
+    client = mocker.patch.object(upstream, "get_client").return_value
+    client.get_json.return_value = specialist
+    assert tools.fetch_character() == specialist
+    assert recorded.choice() == specialist
+
+
+def test_fallback_mode(recorded, halfling, mocker):
+    """Are recorded characters served when the remote generator is down?"""
+    mocker.patch.object(tools, "CHARACTER_SOURCE", "remote")
+    mocker.patch.object(tools, "PREFETCH_DEPTH", 0)
+    client = mocker.patch.object(upstream, "get_client").return_value
+    client.get_json.side_effect = upstream.UpstreamUnavailable("Down")
+
+    with pytest.raises(upstream.UpstreamUnavailable):
+        tools.fetch_character("Halfling")
+    mocker.patch.object(tools, "CORPUS_MODES", {"fallback"})
+    assert tools.fetch_character("Halfling") == halfling
@@ -123,3 +123,210 @@ def test_getBit():
     assert encode.getBit(num, 5) == 1
     num += 1
     assert encode.getBit(num, 0) == 1
+
+
+@pytest.mark.parametrize(
+    "example",
+    [
+        "A",
+        "FRED",
+        " :^)",
+        "tacocat",
+        "never odd or even",
+        "go hang a salami, I'm a lasagna hog",
+    ],
+)
+def test_encode_many_and_decode_many(example):
+    """
+    Do the batch functions give the same output as encode() and decode()?
+    """
+    encoded = encode.encode_many(example.encode())
+    assert encoded.tolist() == encode.encode(example)
+    assert encode.decode_many(encoded) == example
+    assert encode.decode_many(encode.encode(example)) == encode.decode(
+        encode.encode(example)
+    )
+
+
+def test_decode_many_too_long_integer():
+    """
+    Does decode_many() reject integers over 32 bits, like decode() does?
+    """
+    with pytest.raises(ValueError):
+        encode.decode_many([1659684413514848461451648])
+    with pytest.raises(ValueError):
+        encode.decode_many([1 << 32])
+
+
+def test_every_ascii_character():
+    """
+    Does every ASCII character survive encoding and decoding in every position
+    of a chunk?
+    """
+    for code in range(1, 128):
+        for position in range(4):
+            string = " " * position + chr(code)
+            assert encode._decode(encode._encode(string)) == string
+
+
+@pytest.mark.parametrize("max_length, bit_shift", [(2, 2), (4, 4), (8, 8), (3, 4)])
+def test_codec_sizes(max_length, bit_shift):
+    """
+    Do codecs with other chunk sizes round-trip strings, keep their integers
+    within the word size, and agree with their batch functions?
+    """
+    codec = encode.get_codec(max_length, bit_shift)
+    string = "This must be Thursday. I never could get the hang of Thursdays."
+    integers = codec.encode(string)
+
+    assert len(integers) == -(-len(string) // max_length)
+    assert max(integers).bit_length() <= 8 * bit_shift
+    assert codec.decode(integers) == string
+    assert codec.encode_many(string.encode()).tolist() == integers
+    assert codec.decode_many(integers) == string
+
+
+def test_get_codec_is_cached():
+    """
+    Does get_codec() give back the same codec for the same configuration, with the
+    default configuration matching the specification?
+    """
+    assert encode.get_codec() is encode.DEFAULT_CODEC
+    assert encode.get_codec(8, 8) is encode.get_codec(max_length=8, bit_shift=8)
+    assert encode.get_codec(8, 8).encode("FRED") == [
+        encode.get_codec(8, 8).encode_chunk("FRED")
+    ]
+    with pytest.raises(ValueError):
+        encode.get_codec(max_length=5, bit_shift=4)
+
+
+@pytest.mark.parametrize(
+    "example",
+    ["naïve café", "Ça va? ☕", "日本語のテキスト", "🐍🐍🐍🐍🐍", "ü" * 300],
+)
+def test_non_ascii_round_trip(example):
+    """
+    Do strings with multi-byte characters encode into 32-bit integers, 4 bytes at a
+    time, and decode back to the same string?
+    """
+    integers = encode.encode(example)
+    assert len(integers) == -(-len(example.encode()) // 4)
+    assert max(integers).bit_length() <= 32
+    assert encode.decode(integers) == example
+    assert encode.decode_many(integers) == example
+
+
+@pytest.mark.parametrize("buffer_type", [bytes, bytearray, memoryview])
+def test_encode_bytes(buffer_type):
+    """
+    Does encode_bytes() accept any bytes-like object, and does decode_bytes() give
+    the same bytes back?
+    """
+    data = "egad, a base tone denotes a bad age".encode()
+    integers = encode.encode_bytes(buffer_type(data))
+    assert integers == encode.encode("egad, a base tone denotes a bad age")
+    assert encode.decode_bytes(integers) == data
+
+
+@pytest.mark.parametrize("max_length, bit_shift", [(4, 4), (8, 8), (2, 2)])
+def test_packed_file_round_trip(tmp_path, max_length, bit_shift):
+    """
+    Do integers written in the packed format decode from the memory-mapped file to
+    the original string?
+    """
+    codec = encode.get_codec(max_length, bit_shift)
+    string = "So long, and thanks for all the fish."
+    integers = codec.encode(string)
+    path = tmp_path / "fish.alpk"
+
+    assert encode.write_packed(integers, path, codec) == len(integers)
+    assert path.stat().st_size == encode.PACKED_HEADER.size + len(integers) * bit_shift
+
+    loaded_codec, words = encode.load_packed(path)
+    assert loaded_codec is codec
+    assert words.tolist() == integers
+    assert encode.decode_packed(path) == string
+
+
+def test_read_packed_rejects_bad_data():
+    """
+    Does read_packed() refuse data without a valid header or with missing words?
+    """
+    packed = encode.pack(encode.encode("tacocat"))
+    assert encode.read_packed(packed)[1].tolist() == [267487694, 125043731]
+
+    with pytest.raises(ValueError):
+        encode.read_packed(b"JUNK" + packed[4:])
+    with pytest.raises(ValueError):
+        encode.read_packed(packed[:-1])
+    with pytest.raises(ValueError):
+        encode.pack([1 << 32])
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 4, 7, 1024])
+def test_command_line_blocks(tmp_path, block_size):
+    """
+    Does the command line give the same output as a whole-input encode, whatever
+    size blocks it reads the input in, and decode that output back again?
+    """
+    string = "never odd or even, naïve café ☕, egad, a base tone denotes a bad age"
+    source = tmp_path / "source.txt"
+    encoded = tmp_path / "encoded.txt"
+    decoded = tmp_path / "decoded.txt"
+    source.write_bytes(string.encode())
+
+    encode.main(["encode", str(source), "-o", str(encoded), "-b", str(block_size)])
+    expected = " ".join(str(integer) for integer in encode.encode(string))
+    assert encoded.read_text() == expected + "\n"
+
+    encode.main(["decode", str(encoded), "-o", str(decoded), "-b", str(block_size)])
+    assert decoded.read_bytes() == string.encode()
+
+
+def test_parallel_matches_batch(monkeypatch):
+    """
+    Do the parallel functions give the same output as the batch functions, however
+    the input divides between the processes?
+    """
+    monkeypatch.setattr(encode, "PARALLEL_THRESHOLD", 0)
+    data = ("The answer is 42. ☕ " * 1001).encode()
+
+    integers = encode.encode_parallel(data, processes=3)
+    assert integers.tolist() == encode.encode_many(data).tolist()
+    assert encode.decode_parallel(integers, processes=3) == data.decode()
+
+
+def test_parallel_below_threshold(mocker):
+    """
+    Do small inputs skip the process pool?
+    """
+    pool = mocker.patch("artlogic.encode.ProcessPoolExecutor")
+    assert encode.encode_parallel(b"FRED", processes=4).tolist() == [251792692]
+    assert encode.decode_parallel([251792692], processes=4) == "FRED"
+    pool.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("1 2 3", [1, 2, 3]),
+        ("  1\t\t2\n3\r\n", [1, 2, 3]),
+        ("-1 +2", [-1, 2]),
+        ("1 2 x", None),
+        ("1-2", None),
+        ("", None),
+        ("   ", None),
+        ("12 ٣", None),
+        ("1" * 30, None),
+    ],
+)
+def test_parse_integers(text, expected):
+    """
+    Does parse_integers() read lists of integers separated by any whitespace, and
+    reject anything else?
+    """
+    result = encode.parse_integers(text)
+    if expected is None:
+        assert result is None
+    else:
+        assert result.tolist() == expected
@@ -0,0 +1,153 @@
+import pytest
+import io
+import re
+from PyPDF2 import PdfFileReader
+import lament_mod.filler as filler
+import lament_mod.lament as lament
+import lament_mod.render as render
+import lament_mod.spells as spells
+
+
+@pytest.fixture
+def sheet():
+    return filler.get_template(lament.FILLABLE_CHARACTER_SHEET)
+
+
+def page_content(pdf, page_number=0):
+    reader = PdfFileReader(io.BytesIO(pdf))
+    return reader.getPage(page_number).getContents().getData()
+
+
+@pytest.mark.parametrize(
+    "path, field",
+    [
+        (lament.FILLABLE_CHARACTER_SHEET, "class"),
+        (spells.FILLABLE_SPELL_SHEET, "MagicNotes"),
+    ],
+)
+def test_fields_are_read(path, field):
+    """Are the templates' text fields found, with their positions and font sizes?"""
+    template = filler.get_template(path)
+    assert field in template.fields
+    assert template.fields[field].font_size > 0
+    assert template.fields[field].width > 0
+
+
+def test_fill_flattens(sheet):
+    """Does a filled sheet have the values drawn in, and no form fields left?"""
+    pdf = sheet.fill_bytes({"class": "Halfling", "hp": 4, "not_a_field": "Nope"})
+    reader = PdfFileReader(io.BytesIO(pdf))
+    assert reader.getNumPages() == sheet.page_count
+    assert "/AcroForm" not in reader.trailer["/Root"]
+    for page_number in range(reader.getNumPages()):
+        assert "/Annots" not in reader.getPage(page_number)
+
+    content = page_content(pdf)
+    assert b"(Halfling) Tj" in content
+    assert b"(4) Tj" in content
+    assert b"Nope" not in content
+
+
+def test_template_can_be_filled_again(sheet):
+    """Is the template left untouched by filling, so the next fill starts fresh?"""
+    sheet.fill_bytes({"class": "Fighter"})
+    assert b"Fighter" not in page_content(sheet.fill_bytes({"class": "Elf"}))
+
+
+def test_background_is_shared(sheet):
+    """Is the template's artwork only written once, however many sheets there are?"""
+    one = render.Document()
+    sheet.render({"class": "Cleric"}, one)
+    many = render.Document()
+    for i in range(10):
+        sheet.render({"class": "Cleric"}, many)
+
+    one_size, many_size = len(one.to_bytes()), len(many.to_bytes())
+    assert one_size > sheet.background.size
+    assert many_size - one_size < sheet.background.size / 10
+    assert (
+        PdfFileReader(io.BytesIO(many.to_bytes())).getNumPages() == 10 * sheet.page_count
+    )
+
+
+def test_stream_is_lazy(sheet):
+    """Does streaming a document only take pages as fast as it writes them?"""
+    taken = []
+
+    def pages():
+        for i in range(3):
+            taken.append(i)
+            yield from filler.fill_sheet(sheet.path, {"class": "Dwarf"}).pages()
+
+    chunks = render.stream(pages())
+    header = next(chunks)
+    assert taken == []
+    first_page = next(chunks)
+    assert taken == [0]
+
+    pdf = header + first_page + b"".join(chunks)
+    assert taken == [0, 1, 2]
+    assert PdfFileReader(io.BytesIO(pdf)).getNumPages() == 3 * sheet.page_count
+
+
+def test_stream_loads_templates_mid_document(sheet):
+    """Is a template loaded while the document is being written numbered safely?"""
+
+    def pages():
+        yield from filler.fill_sheet(sheet.path, {"class": "Dwarf"}).pages()
+        # Not get_template() - this one is new, so its artwork is reserved right now.
+        late = filler.FormTemplate(spells.FILLABLE_SPELL_SHEET)
+        for page_number, content in enumerate(late.draw({"MagicNotes": "Late"})):
+            yield late.background, page_number, content
+
+    pdf = b"".join(render.stream(pages()))
+    numbers = re.findall(rb"^(\d+) 0 obj", pdf, re.MULTILINE)
+    assert len(numbers) == len(set(numbers))
+
+    reader = PdfFileReader(io.BytesIO(pdf))
+    assert reader.getNumPages() == sheet.page_count + 2
+    for page_number in range(reader.getNumPages()):
+        page = reader.getPage(page_number)
+        background = page["/Resources"]["/XObject"][render.BACKGROUND_NAME]
+        assert background["/Subtype"] == "/Form"
+
+
+def test_combined_template_file():
+    """Does the caster sheet PDF have the same fields as the template built from its parts?"""
+    pdf = filler.FormTemplate(lament.FILLABLE_CASTER_SHEET)
+    combined = filler.get_template(lament.FILLABLE_CASTER_SHEET)
+    assert isinstance(combined, filler.CombinedTemplate)
+    assert pdf.page_count == combined.page_count
+    assert sorted(pdf.fields) == sorted(combined.fields)
+    assert "Character:class" in pdf.fields and "Spells:MagicNotes" in pdf.fields
+    for name, field in pdf.fields.items():
+        assert field.page == combined.fields[name].page
+        assert (field.x0, field.y1) == (
+            combined.fields[name].x0,
+            combined.fields[name].y1,
+        )
+
+
+def test_empty_values_are_skipped(sheet):
+    """Are None and empty values left blank?"""
+    assert b"None" not in page_content(sheet.fill_bytes({"class": None, "hp": ""}))
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Plain", b"Plain"),
+        ("(Parens)", b"\\(Parens\\)"),
+        ("Back\\slash", b"Back\\\\slash"),
+        ("120’", b"120\x92"),
+    ],
+)
+def test_escape(text, expected):
+    """Are strings escaped and encoded for a WinAnsi PDF string literal?"""
+    assert filler.escape(text) == expected
+
+
+def test_wrap():
+    """Is long text wrapped at spaces, and are explicit newlines kept?"""
+    width = filler.text_width("aaa aaa", 10)
+    assert filler.wrap("aaa aaa aaa aaa\nbbb", width, 10) == ["aaa aaa", "aaa aaa", "bbb"]
@@ -0,0 +1,71 @@
+import pytest
+import json
+import random
+import lament_mod.character as character
+import lament_mod.generator as generator
+import lament_mod.tools as tools
+
+
+@pytest.fixture
+def remote_character():
+    with open("tests/mocked_fetch_character.json", "r") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize(
+    "score, expected",
+    [(3, "3 (-3)"), (5, "5 (-2)"), (9, "9"), (14, "14 (+1)"), (18, "18 (+3)")],
+)
+def test_format_attribute(score, expected):
+    """Are attributes formatted the same way as the remote generator formats them?"""
+    assert generator.format_attribute(score) == expected
+
+
+def test_same_shape_as_remote(remote_character):
+    """Does a local character have everything a remote one does (and a level)?"""
+    details = generator.generate_character()
+    assert set(remote_character) | {"level"} == set(details)
+    for key, value in remote_character.items():
+        if value is not None:
+            assert isinstance(details[key], type(value))
+
+
+@pytest.mark.parametrize("pc_class", generator.CLASSES)
+def test_generate_character(pc_class):
+    """Are characters of every class generated with sensible details?"""
+    details = generator.generate_character(pc_class)
+    assert details["class"] == pc_class
+    assert details["level"] == 1
+    for name, score in details["attributes"]:
+        assert 3 <= score <= 18
+        assert details["attr"][name].startswith(str(score))
+    assert details["hp"] >= character.MIN_HP[character.CLASS_MAP[pc_class.casefold()]]
+    assert any(item.endswith(" Cp") for item in details["equipment"])
+    if pc_class == "Magic-User":
+        assert "Read Magic" in details["spell"]
+    else:
+        assert details["spell"] is None
+
+
+def test_seeded_generation():
+    """Does the same seed always give the same character?"""
+    first = generator.generate_character(rng=random.Random(7))
+    second = generator.generate_character(rng=random.Random(7))
+    assert first == second
+
+
+def test_unknown_class():
+    """Are unknown classes refused?"""
+    with pytest.raises(ValueError):
+        generator.generate_character("Bard")
+
+
+@pytest.mark.parametrize("pc_class", generator.CLASSES)
+def test_local_character_builds(pc_class, mocker):
+    """Can a full LotFPCharacter be built from a locally generated character?"""
+    mocker.patch.object(tools, "CHARACTER_SOURCE", "local")
+    mock_get = mocker.patch("lament_mod.upstream.requests.Session.get")
+    pc = character.LotFPCharacter(desired_class=pc_class)
+    assert pc.pcClass is character.CLASS_MAP[pc_class.casefold()]
+    assert "Encumbrance" in pc.details
+    mock_get.assert_not_called()
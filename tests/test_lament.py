@@ -1,5 +1,12 @@
 import pytest
+import copy
+import io
 import json
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+import lament_mod.lament as lament
 
 LAMENT_APP_LOCATION = "http://localhost:42000/character"
 
@@ -45,6 +52,21 @@ def test_bad_data_entered_in_random_field(client, bad_input, expected_message):
     assert expected_message in response.data
 
 
+@pytest.mark.parametrize("source", ["local", "remote"])
+def test_unknown_class(client, mocker, source):
+    """Is a class we can't generate sent back with a message, whatever the source?"""
+    mocker.patch.object(lament.tools, "CHARACTER_SOURCE", source)
+    fetch = mocker.patch.object(lament.tools, "fetch_remote_character")
+    response = client.post(
+        "/lament",
+        data={"desired_class": "Bard", "desired_level": 1},
+        follow_redirects=True,
+    )
+    assert response.status_code == 200
+    assert b"Bard? Never heard of" in response.data
+    assert not fetch.called
+
+
 def test_generating_over_20_characters(client, mocker):
     """Does the app generate only one character when asked for >20?"""
     mock_fetch = mocker.patch("lament_mod.lament.tools.fetch_character")
@@ -86,3 +108,235 @@ def test_generating_over_20_characters(client, mocker):
 #     header_content = response.headers.get('Content-Disposition')
 #     assert "filename=" in header_content
 #     assert chosen_class in header_content
+
+
+def test_fetch_party_is_concurrent(mocker):
+    """Are a party's details fetched at the same time, but no more than the limit?"""
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def slow_fetch(char_class):
+        with lock:
+            running.append(char_class)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return {"class": char_class}
+
+    mocker.patch("lament_mod.lament.tools.fetch_character", side_effect=slow_fetch)
+    party = lament.fetch_party(20, "Elf")
+    assert party == [{"class": "Elf"}] * 20
+    assert 1 < max(peak) <= lament.MAX_CONCURRENT_FETCHES
+
+
+def test_generate_individual_chars_keeps_order(mocker):
+    """Is each fetched character built with its own details and counter, in order?"""
+    party = [{"class": "Fighter", "number": i} for i in range(5)]
+    mocker.patch.object(lament, "fetch_party", return_value=party)
+    mock_character = mocker.patch("lament_mod.lament.character.LotFPCharacter")
+    mock_character.return_value.is_spellcaster.return_value = False
+    mock_character.return_value.details = {}
+    mocker.patch.object(lament, "fill_sheet", side_effect=lambda PC: PC)
+    mocker.patch.object(lament, "FILL_PROCESSES", 1)
+
+    sheets = list(lament.generate_individual_chars(5, None, 1))
+    assert len(sheets) == 5
+    for i, call in enumerate(mock_character.call_args_list):
+        assert call[1]["counter"] == i
+        assert call[1]["details"] is party[i]
+
+
+@pytest.fixture
+def fill_pool(mocker):
+    """A fresh pool of two fill processes, shut down after the test."""
+    mocker.patch.object(lament, "FILL_PROCESSES", 2)
+    mocker.patch.object(lament, "_fill_pool", None)
+    yield
+    lament.get_fill_pool().shutdown()
+
+
+def test_fill_processes(fill_pool):
+    """Are every character's sheets filled by the process pool, and kept in order?"""
+    sheets = lament.generate_individual_chars(3, "Magic-User", 1)
+    assert [sheet.template_path for sheet in sheets] == [lament.FILLABLE_CASTER_SHEET] * 3
+
+
+def test_broken_fill_pool_is_replaced(fill_pool):
+    """Does a fill process dying only break the request it happened in?"""
+    broken = lament.get_fill_pool()
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result()
+
+    sheets = lament.generate_individual_chars(3, "Magic-User", 1)
+    assert [sheet.template_path for sheet in sheets] == [lament.FILLABLE_CASTER_SHEET] * 3
+    assert lament.get_fill_pool() is not broken
+
+
+def test_fill_result_falls_back_to_filling_here(mocker):
+    """Is a sheet whose pool broke while it was being filled filled in-process?"""
+    pool = mocker.Mock()
+    mocker.patch.object(lament, "_fill_pool", pool)
+    future = mocker.Mock()
+    future.result.side_effect = BrokenProcessPool()
+
+    assert lament.fill_result(pool, future, str.upper, ("sheet",)) == "SHEET"
+    assert lament._fill_pool is None
+    pool.shutdown.assert_called_once_with(wait=False)
+
+
+@pytest.mark.parametrize("combine", [True, False])
+def test_caster_fills(mocker, combine):
+    """Do casters get one combined fill, or two separate ones when that's turned off?"""
+    mocker.patch.object(lament, "COMBINE_CASTER_SHEETS", combine)
+    party = [
+        lament.tools.fetch_character("Cleric"),
+        lament.tools.fetch_character("Fighter"),
+    ]
+    fills = [fill for fill, args in lament.get_fills(party, None, 1)]
+    if combine:
+        assert fills == [lament.fill_caster_sheet, lament.fill_sheet]
+    else:
+        assert fills == [
+            lament.fill_sheet,
+            lament.spells.create_spellsheet_pdf,
+            lament.fill_sheet,
+        ]
+
+
+def test_caster_sheet_matches_separate_sheets(sheet_cache):
+    """Is a combined caster sheet the same as a character sheet plus a spell sheet?"""
+    PC = lament.build_character(lament.tools.fetch_character("Magic-User"), 0, None, 1)
+    # Filling the spell sheet adds to the character's spell list, so each fill gets
+    # its own copy.
+    twin = copy.deepcopy(PC)
+    combined = lament.fill_caster_sheet(PC)
+    separate = [
+        lament.fill_sheet(twin),
+        lament.spells.create_spellsheet_pdf(twin.details),
+    ]
+
+    assert combined.contents == separate[0].contents + separate[1].contents
+    assert [page[:2] for page in combined.pages()] == [
+        page[:2] for sheet in separate for page in sheet.pages()
+    ]
+
+
+@pytest.fixture
+def sheet_cache(mocker):
+    """An empty spell sheet cache, in memory only."""
+    sheets = lament.cache.SheetCache(directory=None)
+    mocker.patch.object(lament.cache, "get_cache", return_value=sheets)
+    return sheets
+
+
+def test_caster_sheet_uses_cached_spell_sheet(mocker, sheet_cache):
+    """Is a caster's spell sheet cached, and only their character sheet filled after?"""
+    PC = lament.build_character(lament.tools.fetch_character("Cleric"), 0, None, 1)
+    twin = copy.deepcopy(PC)
+    combined = lament.fill_caster_sheet(PC)
+    assert len(sheet_cache) == 1
+
+    fill_sheet = mocker.spy(lament.filler, "fill_sheet")
+    assert lament.fill_caster_sheet(twin).contents == combined.contents
+    assert lament.spells.create_spellsheet_pdf(twin.details).contents == (
+        combined.contents[lament.template_page_count(lament.FILLABLE_CHARACTER_SHEET) :]
+    )
+    assert fill_sheet.call_count == 0
+
+
+def test_concurrent_casters_fill_spell_sheet_once(mocker, sheet_cache):
+    """Do casters with the same spell sheet, at the same time, only fill it once?"""
+    party = [
+        lament.build_character(lament.tools.fetch_character("Cleric"), i, None, 1)
+        for i in range(4)
+    ]
+    fill_sheet = lament.filler.fill_sheet
+    filled = []
+
+    def slow_fill_sheet(template_path, values):
+        filled.append(template_path)
+        time.sleep(0.05)
+        return fill_sheet(template_path, values)
+
+    mocker.patch.object(lament.filler, "fill_sheet", side_effect=slow_fill_sheet)
+    sheets = []
+    threads = [
+        threading.Thread(target=lambda PC=PC: sheets.append(lament.fill_caster_sheet(PC)))
+        for PC in party
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert filled == [lament.FILLABLE_CASTER_SHEET]
+    assert [sheet.template_path for sheet in sheets] == [lament.FILLABLE_CASTER_SHEET] * 4
+
+
+def test_merge_filled_sheets():
+    """Are in-process sheets merged into one PDF, with each template's artwork once?"""
+    sheet = lament.filler.fill_sheet(lament.FILLABLE_CHARACTER_SHEET, {"Name": "Bob"})
+    chunks = list(lament.mergePDFs(iter([sheet] * 3)))
+    merged = b"".join(chunks)
+
+    template = lament.filler.get_template(lament.FILLABLE_CHARACTER_SHEET)
+    # The header, a chunk per page, and the page tree and cross-reference table.
+    assert len(chunks) == 3 * template.page_count + 2
+    assert len(merged) < 2 * template.background.size
+    reader = lament.PdfFileReader(io.BytesIO(merged))
+    assert reader.getNumPages() == 3 * template.page_count
+
+
+@pytest.fixture
+def fake_pdftk(tmp_path, mocker):
+    """A stand-in for pdftk that "fills" a sheet by writing out the blank one."""
+    script = tmp_path / "pdftk"
+    script.write_text('#!/bin/sh\ncat > /dev/null\ncat "$1"\n')
+    script.chmod(0o755)
+    mocker.patch("lament_mod.tools.get_pdftk_path", return_value=str(script))
+    mocker.patch("lament_mod.tools.PDF_FILLER", "pdftk")
+    return script
+
+
+@pytest.mark.skipif(os.name != "posix", reason="The fake pdftk is a shell script")
+def test_generate_party_with_fake_pdftk(client, fake_pdftk):
+    """Is a party merged into one PDF with pdftk, too?"""
+    response = client.post("/lament", data={"randos": 2, "desired_level": 1})
+    assert response.status_code == 200
+    assert response.mimetype == "application/pdf"
+    assert "2Characters" in response.headers.get("Content-Disposition")
+    assert response.data.startswith(b"%PDF")
+    response.close()
+    assert not os.path.exists(os.path.join("FinalPDF", "2Characters.pdf"))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="The fake pdftk is a shell script")
+def test_casters_with_fake_pdftk(mocker, fake_pdftk, sheet_cache):
+    """Does every caster take one pdftk run, with their spell sheet cached or not?"""
+    mocker.patch.object(lament, "FILL_PROCESSES", 1)
+    fill_with_pdftk = mocker.spy(lament.tools, "fill_with_pdftk")
+    sheets = list(lament.generate_individual_chars(2, "Cleric", 1))
+
+    assert [args[0] for args, kwargs in fill_with_pdftk.call_args_list] == [
+        lament.FILLABLE_CASTER_SHEET,
+        lament.FILLABLE_CHARACTER_SHEET,
+    ]
+    pages = [lament.PdfFileReader(io.BytesIO(sheet)).getNumPages() for sheet in sheets]
+    assert pages == [
+        lament.template_page_count(lament.FILLABLE_CASTER_SHEET),
+        lament.template_page_count(lament.FILLABLE_CHARACTER_SHEET),
+        lament.template_page_count(lament.spells.FILLABLE_SPELL_SHEET),
+    ]
+
+
+@pytest.mark.parametrize("filler", ["builtin", "pdftk"])
+def test_failed_fill_is_not_streamed(client, mocker, filler):
+    """Does a fill that fails get an error, rather than the start of a PDF?"""
+    mocker.patch.object(lament.tools, "PDF_FILLER", filler)
+    mocker.patch.object(lament, "FILL_PROCESSES", 1)
+    mocker.patch.object(lament, "fill_sheet", side_effect=RuntimeError)
+    mocker.patch.object(lament, "fill_caster_sheet", side_effect=RuntimeError)
+    with pytest.raises(RuntimeError):
+        client.post("/lament", data={"randos": 2, "desired_level": 1})
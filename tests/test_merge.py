@@ -0,0 +1,82 @@
+import pytest
+import io
+from PyPDF2 import PdfFileMerger, PdfFileReader
+import lament_mod.filler as filler
+import lament_mod.lament as lament
+import lament_mod.merge as merge
+import lament_mod.spells as spells
+
+
+@pytest.fixture
+def sheets():
+    """Whole filled PDFs, like pdftk makes: a character sheet and a spell sheet each."""
+    character_sheet = filler.get_template(lament.FILLABLE_CHARACTER_SHEET)
+    spell_sheet = filler.get_template(spells.FILLABLE_SPELL_SHEET)
+    pdfs = []
+    for pc_class in ("Cleric", "Elf", "Magic-User"):
+        pdfs.append(character_sheet.fill_bytes({"class": pc_class}))
+        pdfs.append(spell_sheet.fill_bytes({"MagicNotes": pc_class + " notes"}))
+    return pdfs
+
+
+def merged(pdfs):
+    merger = merge.Merger()
+    for pdf in pdfs:
+        merger.append(pdf)
+    return merger.to_bytes()
+
+
+def test_pages_are_kept_in_order(sheets):
+    """Does every page make it into the merged PDF, in the order it was added?"""
+    reader = PdfFileReader(io.BytesIO(merged(sheets)))
+    pages = [PdfFileReader(io.BytesIO(pdf)).getNumPages() for pdf in sheets]
+    assert reader.getNumPages() == sum(pages)
+
+    def text(sheet):
+        start = sum(pages[:sheet])
+        return b"".join(
+            reader.getPage(i).getContents().getData()
+            for i in range(start, start + pages[sheet])
+        )
+
+    assert b"(Cleric) Tj" in text(0)
+    assert b"(Cleric notes) Tj" in text(1)
+    assert b"(Magic-User) Tj" in text(4)
+
+
+def test_shared_objects_are_stored_once(sheets):
+    """Is a party much smaller than its sheets, once their artwork is deduplicated?"""
+    merger = PdfFileMerger()
+    for pdf in sheets:
+        merger.append(PdfFileReader(io.BytesIO(pdf)))
+    appended = io.BytesIO()
+    merger.write(appended)
+
+    compact = merged(sheets)
+    assert len(compact) < len(appended.getvalue()) / 2
+    assert len(compact) < len(merged(sheets[:2])) * 1.5
+
+
+def test_self_referencing_objects():
+    """Are objects that refer back to themselves copied without looping forever?"""
+    bodies = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 10 10] /Thing 4 0 R >>",
+        b"<< /Self 4 0 R /Page 3 0 R >>",
+    ]
+    pdf = b"%PDF-1.7\n"
+    offsets = []
+    for number, body in enumerate(bodies, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 5\n0000000000 65535 f \n"
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size 5 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+
+    reader = PdfFileReader(io.BytesIO(merged([pdf, pdf])), strict=False)
+    assert reader.getNumPages() == 2
+    thing = reader.getPage(1)["/Thing"]
+    assert thing["/Self"].getObject() is thing
+    assert thing["/Page"].getObject()["/MediaBox"] == [0, 0, 10, 10]
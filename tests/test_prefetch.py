@@ -0,0 +1,94 @@
+import pytest
+import itertools
+import json
+import lament_mod.prefetch as prefetch
+import lament_mod.tools as tools
+import lament_mod.upstream as upstream
+
+
+@pytest.fixture
+def characters():
+    """An endless supply of alternating Halflings and Specialists."""
+    with open("tests/mocked_fetch_character.json", "r") as f:
+        halfling = json.load(f)
+    with open("tests/mocked_fetch_specialist.json", "r") as f:
+        specialist = json.load(f)
+    supply = itertools.cycle([halfling, specialist])
+    return lambda *args: dict(next(supply))
+
+
+@pytest.fixture
+def pool(characters):
+    pool = prefetch.CharacterPool(
+        characters, depths={"Halfling": 2, "Specialist": 3}, default_depth=0
+    )
+    yield pool
+    pool.stop(timeout=1)
+
+
+def wait_until_full(pool, timeout=2):
+    for _ in range(int(timeout / 0.01)):
+        if not pool.needs_more():
+            return
+        pool.stopped.wait(0.01)
+    pytest.fail("The pool never filled up")
+
+
+def test_pool_fills_every_class(pool):
+    """Does the prefetcher top up each class's queue to its depth?"""
+    pool.start()
+    wait_until_full(pool)
+    assert pool.queues["Halfling"].qsize() == 2
+    assert pool.queues["Specialist"].qsize() == 3
+    assert pool.queues["Cleric"].qsize() == 0
+
+
+def test_pool_take(pool):
+    """Are characters taken from the right queue, and None given when it's empty?"""
+    pool.start()
+    wait_until_full(pool)
+    assert pool.take("Specialist")["class"] == "Specialist"
+    assert pool.take("Cleric") is None
+    assert pool.take("Bard") is None
+
+
+def test_pool_put(pool, characters):
+    """Are characters kept in their own class's queue until it's full?"""
+    halfling = characters()
+    assert pool.put(halfling)
+    assert pool.put(halfling)
+    assert not pool.put(halfling)
+    assert not pool.put({"class": "Bard"})
+    assert not pool.put({"class": "Cleric"})
+    assert pool.queues["Halfling"].qsize() == 2
+
+
+def test_pool_survives_upstream_failures(mocker):
+    """Does the prefetcher wait and retry when the upstream is down?"""
+    mocker.patch.object(prefetch, "RETRY_DELAY", 0.01)
+    fetch = mocker.Mock(
+        side_effect=[upstream.UpstreamUnavailable("Down"), {"class": "Elf"}]
+    )
+    pool = prefetch.CharacterPool(fetch, depths={"Elf": 1}, default_depth=0)
+    pool.start()
+    try:
+        wait_until_full(pool)
+    finally:
+        pool.stop(timeout=1)
+    assert pool.take("Elf") == {"class": "Elf"}
+
+
+def test_fetch_character_uses_pool(pool, characters, mocker):
+    """Are class requests served from the pool, with mismatches saved for later?"""
+    mocker.patch.object(tools, "CHARACTER_SOURCE", "remote")
+    mocker.patch.object(prefetch, "get_pool", return_value=pool)
+    client = mocker.Mock()
+    client.get_json.side_effect = characters
+    mocker.patch.object(upstream, "get_client", return_value=client)
+
+    # The pool isn't running, so the first Specialist has to be fetched, and the
+    # Halfling fetched along the way is kept.
+    assert tools.fetch_character("Specialist")["class"] == "Specialist"
+    assert client.get_json.call_count == 2
+    assert tools.fetch_character("Halfling")["class"] == "Halfling"
+    assert client.get_json.call_count == 2
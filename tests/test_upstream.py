@@ -0,0 +1,149 @@
+import pytest
+import json
+import requests
+import lament_mod.tools as tools
+import lament_mod.upstream as upstream
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def make_response(details, status=200):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(details).encode()
+    return response
+
+
+@pytest.fixture
+def specialist():
+    with open("tests/mocked_fetch_specialist.json", "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def upstream_client():
+    return upstream.UpstreamClient(
+        tools.CHARACTER_GEN_URL, breaker=upstream.CircuitBreaker(), sleep=lambda s: None
+    )
+
+
+def test_breaker_opens_and_resets():
+    """Does the breaker fail fast after too many failures, then let a trial through?"""
+    clock = FakeClock()
+    breaker = upstream.CircuitBreaker(threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 11
+    # Only one trial request gets through while half-open.
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+    assert not breaker.is_open
+
+
+def test_failed_trial_reopens_breaker():
+    """Does a failed half-open trial open the breaker again?"""
+    clock = FakeClock()
+    breaker = upstream.CircuitBreaker(threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_client_reuses_session(upstream_client, specialist, mocker):
+    """Do all requests go through the client's pooled session?"""
+    mock_get = mocker.patch.object(
+        upstream_client.session, "get", return_value=make_response(specialist)
+    )
+    assert upstream_client.get_json() == specialist
+    assert upstream_client.get_json() == specialist
+    assert mock_get.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        requests.ConnectionError("Nope"),
+        requests.Timeout("Too slow"),
+        make_response({}, status=503),
+    ],
+)
+def test_client_retries(upstream_client, specialist, mocker, error):
+    """Are connection errors, timeouts and bad statuses retried?"""
+    responses = [error, make_response(specialist)]
+
+    def fake_get(*args, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    mocker.patch.object(upstream_client.session, "get", side_effect=fake_get)
+    assert upstream_client.get_json() == specialist
+
+
+def test_client_gives_up(upstream_client, mocker):
+    """Does the client stop after max_attempts and raise UpstreamUnavailable?"""
+    mock_get = mocker.patch.object(
+        upstream_client.session, "get", side_effect=requests.ConnectionError("Nope")
+    )
+    with pytest.raises(upstream.UpstreamUnavailable):
+        upstream_client.get_json()
+    assert mock_get.call_count == upstream_client.max_attempts
+
+
+def test_client_fails_fast_when_open(upstream_client, mocker):
+    """Does an open breaker stop requests from being made at all?"""
+    mock_get = mocker.patch.object(upstream_client.session, "get")
+    for _ in range(upstream.BREAKER_THRESHOLD):
+        upstream_client.breaker.record_failure()
+    with pytest.raises(upstream.UpstreamUnavailable):
+        upstream_client.get_json()
+    mock_get.assert_not_called()
+
+
+def test_client_respects_deadline(upstream_client, mocker):
+    """Does a deadline that has already passed stop the client from trying?"""
+    mock_get = mocker.patch.object(upstream_client.session, "get")
+    with pytest.raises(upstream.UpstreamUnavailable):
+        upstream_client.get_json(deadline=upstream.time.monotonic() - 1)
+    mock_get.assert_not_called()
+
+
+def test_fetch_character_class_loop_is_bounded(upstream_client, specialist, mocker):
+    """Does fetching a class the upstream never sends eventually give up?"""
+    mocker.patch.object(tools, "CHARACTER_SOURCE", "remote")
+    mocker.patch.object(tools, "PREFETCH_DEPTH", 0)
+    mocker.patch.object(upstream, "get_client", return_value=upstream_client)
+    mock_get = mocker.patch.object(
+        upstream_client.session, "get", return_value=make_response(specialist)
+    )
+    assert tools.fetch_character("Specialist") == specialist
+    with pytest.raises(upstream.UpstreamUnavailable):
+        tools.fetch_character("Cleric")
+    assert mock_get.call_count == 1 + tools.MAX_CLASS_ATTEMPTS
+
+
+def test_lament_flashes_upstream_errors(client, mocker):
+    """Does the app tell the user when the upstream is down, instead of crashing?"""
+    mocker.patch(
+        "lament_mod.lament.tools.fetch_character",
+        side_effect=upstream.UpstreamUnavailable("Down"),
+    )
+    response = client.post(
+        "/lament", data={"randos": 1, "desired_level": 1}, follow_redirects=True
+    )
+    assert response.status_code == 200
+    assert b"taking a nap" in response.data